@@ -0,0 +1,202 @@
+"""
+Alignment of batches of real spectra (icoshift-like).
+
+Shift of every spectrum against reference is position of maximum of their
+cross-correlation, which is computed by FFT (backend of processing.set_fft_backend)
+for 2D array of spectra (one per row) at once. Spectra are zero padded, so that correlation is not circular.
+Shifts are whole data points, they are applied by indexing
+(np.take_along_axis), points shifted in from outside are filled
+by edge values (or by given value), no spectrum is interpolated.
+Segment-wise alignment shifts every segment separately, so that lines which move
+differently (e.g. with pH) are aligned too.
+
+aligned, shifts = align(spectra, "mean", max_shift=50)
+aligned, shifts = align_segments(aligned, 64, max_shift=10)
+"""
+import numpy as np
+
+import processing
+
+
+def make_reference(spectra, reference):
+    """
+    Returns reference spectrum, reference is "mean", "median",
+    number of spectrum in batch or spectrum (np.array) itself
+    """
+    if isinstance(reference, str):
+        if reference == "mean":
+            return spectra.mean(axis=0)
+        if reference == "median":
+            return np.median(spectra, axis=0)
+        raise NotImplementedError(f"not implemented reference {reference}")
+    if np.ndim(reference) == 0:
+        return spectra[reference]
+    return np.asarray(reference)
+
+def cross_correlation_shifts(spectra, reference, max_shift=None):
+    """
+    Returns shifts [data points] of spectra against reference
+
+    Parameters
+    ----------
+    spectra : np.array
+        real spectrum, or 2D array of spectra.
+    reference : np.array
+        real spectrum of the same length.
+    max_shift : int
+        maximal absolute value of shift, default is length of spectra - 1.
+
+    Returns
+    -------
+    int or np.array
+        shift of every spectrum, positive if spectrum is moved to higher points
+        (to the right) against reference
+
+    """
+    length = spectra.shape[-1]
+    if max_shift is None or max_shift >= length:
+        max_shift = length - 1
+    size = processing.next_fast_size(2*length)
+    # transforms use backend chosen by processing.set_fft_backend
+    correlation = processing.irfft(processing.rfft(spectra, size) * np.conj(processing.rfft(reference, size)), size)
+    # lags 0, 1, ..., max_shift, -max_shift, ..., -1 are at these positions of circular correlation
+    lags = np.concatenate((np.arange(max_shift + 1), np.arange(-max_shift, 0)))
+    return lags[np.argmax(correlation[..., lags % size], axis=-1)]
+
+def shift_spectra(spectra, shifts, fill="edge"):
+    """
+    Returns spectra moved back by shifts (from cross_correlation_shifts),
+    point j of result is point j + shift of spectrum
+
+    Parameters
+    ----------
+    spectra : np.array
+        2D array of spectra.
+    shifts : np.array of int
+        shift of every spectrum.
+    fill : "edge" or float
+        value of points shifted in from outside of spectrum, "edge" repeats edge points.
+
+    Returns
+    -------
+    np.array
+        shifted spectra
+
+    """
+    length = spectra.shape[-1]
+    indices = np.arange(length) + np.asarray(shifts)[:, np.newaxis]
+    shifted = np.take_along_axis(spectra, np.clip(indices, 0, length - 1), axis=-1)
+    if fill != "edge":
+        shifted[(indices < 0) | (indices >= length)] = fill
+    return shifted
+
+def align(spectra, reference="mean", max_shift=None, fill="edge"):
+    """
+    Aligns whole spectra against reference
+
+    Parameters
+    ----------
+    spectra : np.array
+        2D array of real spectra.
+    reference : str, int or np.array
+        see make_reference.
+    max_shift : int
+        [data points] maximal shift, default is unlimited.
+    fill : "edge" or float
+        see shift_spectra.
+
+    Returns
+    -------
+    (np.array, np.array)
+        aligned spectra and shift of every spectrum
+
+    """
+    spectra = np.asarray(spectra)
+    shifts = cross_correlation_shifts(spectra, make_reference(spectra, reference), max_shift)
+    return shift_spectra(spectra, shifts, fill), shifts
+
+def segment_bounds(length, segments):
+    # [data points] (begin, end) of segments, segments is their number (equal segments) or bounds
+    if np.ndim(segments) == 0:
+        edges = np.linspace(0, length, segments + 1).round().astype(np.int64)
+        return list(zip(edges[:-1].tolist(), edges[1:].tolist()))
+    return [(int(begin), int(end)) for begin, end in segments]
+
+def align_segments(spectra, segments, reference="mean", max_shift=None, fill="edge"):
+    """
+    Aligns every segment of spectra separately against the same segment of reference,
+    points outside of segments are not changed
+
+    Parameters
+    ----------
+    spectra : np.array
+        2D array of real spectra.
+    segments : int or sequence of (int, int)
+        number of segments of equal length or their bounds [data points] (begin, end),
+        e.g. regions of multiplets.
+    reference, max_shift, fill
+        the same as of align, reference is computed from whole spectra before alignment.
+
+    Returns
+    -------
+    (np.array, np.array)
+        aligned spectra and shifts, one column per segment
+
+    """
+    spectra = np.asarray(spectra)
+    reference = make_reference(spectra, reference)
+    bounds = segment_bounds(spectra.shape[-1], segments)
+    aligned = spectra.copy()
+    shifts = np.zeros((len(spectra), len(bounds)), dtype=np.int64)
+    # every segment is aligned for all spectra at once
+    for i, (begin, end) in enumerate(bounds):
+        part = spectra[:, begin:end]
+        shifts[:, i] = cross_correlation_shifts(part, reference[begin:end], max_shift)
+        aligned[:, begin:end] = shift_spectra(part, shifts[:, i], fill)
+    return aligned, shifts
+
+def align_spectra(spectra, segments=None, reference="mean", max_shift=None, fill="edge"):
+    """
+    Aligns spectra of Spectrum_1D objects (all of the same length) by align,
+    or by align_segments if segments are given. Objects are not changed.
+
+    Returns
+    -------
+    (np.array, np.array)
+        2D array of aligned spectra and shifts
+
+    """
+    lengths = {len(spectrum.spectrum) for spectrum in spectra}
+    if len(lengths) > 1:
+        raise ValueError("spectra have to be of the same length, use the same zero filling")
+    stacked = np.stack([spectrum.spectrum for spectrum in spectra])
+    if segments is None:
+        return align(stacked, reference, max_shift, fill)
+    return align_segments(stacked, segments, reference, max_shift, fill)
+
+
+if __name__ == "__main__":
+    # timing on batch of synthetic spectra, all lines drift together, lines in right half drift more
+    import time
+
+    rng = np.random.default_rng(0)
+    count, length = 500, 2**14
+    x_axis = np.arange(length)
+    centres = rng.uniform(1000, length - 1000, 40)
+    global_shifts = rng.integers(-100, 101, (count, 1))
+    local_shifts = rng.integers(-5, 6, (count, 1))
+    spectra = rng.normal(0, 0.1, (count, length))
+    for centre in centres:
+        positions = centre + global_shifts + local_shifts*(centre > length/2)
+        spectra += 10 / (1 + ((x_axis - positions)/3)**2)
+
+    def deviation(spectra):
+        return np.abs(spectra - spectra[0]).mean()
+
+    print(f"{count} spectra of {length} points, mean deviation from first {deviation(spectra):.3f}")
+    start = time.perf_counter()
+    aligned, shifts = align(spectra, 0)
+    print(f"global: {1000*(time.perf_counter() - start):.0f} ms, deviation {deviation(aligned):.3f}")
+    start = time.perf_counter()
+    aligned, segment_shifts = align_segments(aligned, 32, 0, max_shift=20)
+    print(f"segments: {1000*(time.perf_counter() - start):.0f} ms, deviation {deviation(aligned):.3f}")
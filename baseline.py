@@ -0,0 +1,315 @@
+"""
+Baseline correction of real spectra.
+
+Methods (names used by BaselineCorrection stage of pipeline):
+    "polynomial" - polynomial fitted to signal-free points found by signal_free_mask
+    "als" - asymmetric least squares, Whittaker smoother with weights favouring points
+            below baseline
+    "whittaker" - Whittaker smoother fitted to signal-free points
+
+Whittaker smoother solves symmetric pentadiagonal system (W + lam*D'D) z = W y
+at full resolution, so it is linear in number of points. scipy.linalg.solveh_banded
+is used if scipy is available, otherwise the same system is solved by vectorized
+block cyclic reduction (solve_pentadiagonal).
+Smoothness lam is scaled by (length/1024)**4, so that the same lam gives
+similar baseline for spectra of different length (e.g. after zero filling).
+Optionally (block parameter) data are smoothed as weighted averages of blocks of points
+and interpolated back, which is faster, baseline is usually smooth at this scale.
+
+baseline = compute_baseline(spectrum, "als", 100.0, 0.01)
+"""
+import numpy as np
+
+# optional, banded solver
+try:
+    import scipy.linalg as scipy_linalg
+except ImportError:
+    scipy_linalg = None
+
+SMOOTHING_POINTS = 2**14
+
+
+def moving_sum(data, window):
+    # sums of data in windows of odd length centered at every point, windows are shortened at edges
+    cumsum = np.concatenate(([0], np.cumsum(data, dtype=np.double)))
+    half = window // 2
+    positions = np.arange(len(data))
+    return cumsum[np.minimum(positions + half + 1, len(data))] - cumsum[np.maximum(positions - half, 0)]
+
+def signal_free_mask(spectrum, window=None, factor=3.0):
+    """
+    Finds points of spectrum which contain only baseline and noise
+
+    Parameters
+    ----------
+    spectrum : np.array
+        real spectrum.
+    window : int
+        [points] width of window in which noise is estimated,
+        default is 1/256 of spectrum, but at least 15 points.
+        Longer spectra than SMOOTHING_POINTS are averaged in blocks first,
+        then window is in blocks.
+    factor : float
+        window is considered to contain signal if standard deviation of first
+        derivative in it is larger than factor*noise, noise is its lower quartile.
+
+    Returns
+    -------
+    np.array of bool
+        True for signal-free points, points closer than window to signal are excluded
+
+    """
+    length = len(spectrum)
+    if length > SMOOTHING_POINTS:
+        # lines of oversampled spectra are too smooth to be found by derivative
+        block = -(-length // SMOOTHING_POINTS)
+        padding = block*(-(-length // block)) - length
+        blocks = np.pad(spectrum, (0, padding), mode="edge").reshape(-1, block).mean(axis=1)
+        return np.repeat(signal_free_mask(blocks, window, factor), block)[:length]
+    if window is None:
+        window = max(length // 256, 15)
+    window = window | 1
+    # derivative is used, so that slowly changing baseline itself is not taken as signal
+    derivative = np.diff(spectrum, append=spectrum[-1:])
+    count = moving_sum(np.ones(length), window)
+    mean = moving_sum(derivative, window) / count
+    variance = moving_sum(derivative*derivative, window) / count - mean*mean
+    deviation = np.sqrt(np.maximum(variance, 0))
+    noise = np.percentile(deviation, 25)
+    signal = deviation > factor*noise
+    # wings of lines
+    signal = moving_sum(signal, 2*window + 1) > 0
+    return ~signal
+
+def difference_penalty(length, lam):
+    """
+    Returns lam*D'D (D - second difference matrix) in upper banded form
+    used by scipy.linalg.solveh_banded: rows are second, first superdiagonal and diagonal
+    """
+    # every row of D is (1, -2, 1), its contributions are summed
+    banded = np.zeros((3, length))
+    banded[0, 2:] = 1
+    banded[1, 1:-1] -= 2
+    banded[1, 2:] -= 2
+    banded[2, :-2] += 1
+    banded[2, 1:-1] += 4
+    banded[2, 2:] += 1
+    return banded * lam
+
+def solve_block_tridiagonal(lower, diagonal, upper, values):
+    """
+    Solves block tridiagonal system by cyclic reduction, every level eliminates all odd
+    block rows at once, so system of n blocks takes log2(n) vectorized levels.
+    Blocks are arrays (n, k, k), lower[0] and upper[-1] have to be zero, values are (n, k).
+    No pivoting, system has to be e.g. symmetric positive definite.
+    """
+    if len(diagonal) <= 2:
+        # dense system of at most two blocks
+        dense = np.block([[diagonal[0], upper[0]], [lower[-1], diagonal[-1]]])
+        size = len(diagonal)*diagonal.shape[-1]
+        return np.linalg.solve(dense[:size, :size], values.ravel()).reshape(values.shape)
+    if len(diagonal) % 2 == 0:
+        # odd number of blocks, so that first and last rows are kept, padded by identity
+        zero = np.zeros_like(diagonal[:1])
+        return solve_block_tridiagonal(
+            np.concatenate((lower, zero)), np.concatenate((diagonal, np.eye(diagonal.shape[-1])[np.newaxis])),
+            np.concatenate((upper, zero)), np.concatenate((values, np.zeros_like(values[:1]))))[:-1]
+    inverse = np.linalg.inv(diagonal[1::2])
+    # even rows 2, 4... use odd row above them, even rows 0, 2... odd row below them
+    above = lower[2::2] @ inverse
+    below = upper[0:-1:2] @ inverse
+    new_lower = np.zeros_like(diagonal[::2])
+    new_upper = np.zeros_like(diagonal[::2])
+    new_diagonal = diagonal[::2].copy()
+    new_values = values[::2].copy()
+    new_diagonal[1:] -= above @ upper[1::2]
+    new_diagonal[:-1] -= below @ lower[1::2]
+    new_lower[1:] = -above @ lower[1::2]
+    new_upper[:-1] = -below @ upper[1::2]
+    new_values[1:] -= (above @ values[1::2, :, np.newaxis])[..., 0]
+    new_values[:-1] -= (below @ values[1::2, :, np.newaxis])[..., 0]
+    result = np.empty_like(values)
+    result[::2] = solve_block_tridiagonal(new_lower, new_diagonal, new_upper, new_values)
+    # odd rows from solved neighbouring rows
+    remaining = (values[1::2] - (lower[1::2] @ result[0:-1:2, :, np.newaxis])[..., 0]
+                 - (upper[1::2] @ result[2::2, :, np.newaxis])[..., 0])
+    result[1::2] = (inverse @ remaining[..., np.newaxis])[..., 0]
+    return result
+
+def solve_pentadiagonal(banded, values):
+    """
+    Solves symmetric positive definite pentadiagonal system given in the same
+    form as for scipy.linalg.solveh_banded. Pairs of points are blocks of block tridiagonal
+    system solved by solve_block_tridiagonal. Used if scipy is not available.
+    """
+    length = len(values)
+    # odd length is padded by independent point
+    padded = length + length % 2
+    second, first, diagonal = (np.pad(i, (0, padded - length)) for i in banded)
+    diagonal[length:] = 1
+    blocks = padded // 2
+    block_diagonal = np.empty((blocks, 2, 2))
+    block_diagonal[:, 0, 0] = diagonal[0::2]
+    block_diagonal[:, 1, 1] = diagonal[1::2]
+    block_diagonal[:, 0, 1] = block_diagonal[:, 1, 0] = first[1::2]
+    # coupling of points 2k, 2k+1 with 2k+2, 2k+3
+    upper = np.zeros((blocks, 2, 2))
+    upper[:-1, 0, 0] = second[2::2]
+    upper[:-1, 1, 0] = first[2::2]
+    upper[:-1, 1, 1] = second[3::2]
+    lower = np.zeros((blocks, 2, 2))
+    lower[1:] = upper[:-1].transpose(0, 2, 1)
+    result = solve_block_tridiagonal(lower, block_diagonal, upper, 
+                                     np.pad(values, (0, padded - length)).reshape(-1, 2))
+    return result.ravel()[:length]
+
+def banded_product(banded, values):
+    # product of symmetric pentadiagonal matrix in upper banded form and vector
+    second, first, diagonal = banded
+    result = diagonal*values
+    result[:-1] += first[1:]*values[1:]
+    result[1:] += first[1:]*values[:-1]
+    result[:-2] += second[2:]*values[2:]
+    result[2:] += second[2:]*values[:-2]
+    return result
+
+def solve_refined(banded, values, iterations=20, tolerance=1e-4):
+    """
+    Solves pentadiagonal system by scipy.linalg.solveh_banded (solve_pentadiagonal without scipy)
+    and refines solution by residuals computed in extended precision (np.longdouble)
+    until relative correction is smaller than tolerance.
+    System of long spectra is too badly conditioned (lam is scaled by (length/1024)**4)
+    for solution in double precision, refinement costs one solution per step.
+    """
+    if scipy_linalg is not None:
+        solve = lambda values : scipy_linalg.solveh_banded(banded, values, check_finite=False)
+    else:
+        solve = lambda values : solve_pentadiagonal(banded, values)
+    result = solve(values).astype(np.longdouble)
+    extended = banded.astype(np.longdouble)
+    previous = np.inf
+    for _ in range(iterations):
+        correction = solve((values - banded_product(extended, result)).astype(np.double))
+        result += correction
+        # refinement stops also when corrections stop decreasing (limit of precision of residuals)
+        size = np.abs(correction).max()
+        if size <= tolerance*np.abs(result).max() or size >= previous:
+            break
+        previous = size
+    return result.astype(np.double)
+
+def whittaker_smooth(data, weights, lam, block=1):
+    """
+    Whittaker smoother: minimizes sum(weights*(data - z)**2) + lam*sum(second_difference(z)**2)
+
+    Parameters
+    ----------
+    data : np.array
+        real data.
+    weights : np.array
+        non negative weights of points, 0 - point is ignored.
+    lam : float
+        smoothness, scaled by (length/1024)**4.
+    block : int
+        if greater than 1, data are averaged (weighted) in blocks of this number of points, 
+        smoothed and linearly interpolated back, faster for baselines smooth at scale of blocks.
+
+    Returns
+    -------
+    np.array
+        smoothed data
+
+    """
+    length = len(data)
+    if length < 3:
+        return data.astype(np.double)
+    if block > 1:
+        padding = block*(-(-length // block)) - length
+        block_weights = np.pad(weights, (0, padding)).reshape(-1, block).sum(axis=1)
+        block_values = np.pad(weights*data, (0, padding)).reshape(-1, block).sum(axis=1)
+        block_data = block_values / np.where(block_weights > 0, block_weights, 1)
+        # mean weight of block keeps balance between fit and smoothness for given lam
+        smoothed = whittaker_smooth(block_data, block_weights/block, lam)
+        starts = np.arange(0, length, block)
+        centers = (starts + np.minimum(starts + block, length) - 1) / 2
+        return np.interp(np.arange(length), centers, smoothed)
+    banded = difference_penalty(length, lam * (length/1024)**4)
+    banded[2] += weights
+    return solve_refined(banded, weights*data)
+
+def polynomial_baseline(spectrum, order=3):
+    # polynomial of given order fitted to signal-free points
+    mask = signal_free_mask(spectrum)
+    x_axis = np.linspace(-1, 1, len(spectrum))
+    if np.count_nonzero(mask) <= order:
+        return np.zeros(len(spectrum))
+    coefficients = np.polynomial.polynomial.polyfit(x_axis[mask], spectrum[mask], order)
+    return np.polynomial.polynomial.polyval(x_axis, coefficients)
+
+def als_baseline(spectrum, lam=100.0, asymmetry=0.01, iterations=10, block=1):
+    """
+    Asymmetric least squares: points above baseline get weight asymmetry,
+    points below 1 - asymmetry, weights are updated until they do not change,
+    block is passed to whittaker_smooth
+    """
+    weights = np.ones(len(spectrum))
+    for _ in range(iterations):
+        baseline = whittaker_smooth(spectrum, weights, lam, block)
+        new_weights = np.where(spectrum > baseline, asymmetry, 1 - asymmetry)
+        if np.array_equal(new_weights, weights):
+            break
+        weights = new_weights
+    return baseline
+
+def whittaker_baseline(spectrum, lam=1.0, block=1):
+    # Whittaker smoother passing through signal-free points, block is passed to whittaker_smooth
+    weights = signal_free_mask(spectrum).astype(np.double)
+    return whittaker_smooth(spectrum, weights, lam, block)
+
+METHODS = {
+    "polynomial" : polynomial_baseline,
+    "als" : als_baseline,
+    "whittaker" : whittaker_baseline,
+    }
+
+def compute_baseline(spectrum, method, *params):
+    """
+    Returns baseline of real spectrum computed by method from METHODS with its params
+    """
+    if method not in METHODS:
+        raise NotImplementedError(f"not implemented baseline correction {method}")
+    return METHODS[method](np.asarray(spectrum, dtype=np.double), *params)
+
+
+if __name__ == "__main__":
+    import time
+
+    # signal-free points of long spectrum (averaged in blocks) must not contain lines
+    rng = np.random.default_rng(0)
+    length = 2**20
+    x_axis = np.linspace(-1, 1, length)
+    centres = rng.uniform(-0.9, 0.9, 30)
+    spectrum = rng.normal(size=length) + 20*x_axis**2
+    for centre in centres:
+        spectrum += 50 / (1 + ((x_axis - centre)/2e-4)**2)
+    mask = signal_free_mask(spectrum)
+    tops = np.round((centres + 1)/2*(length - 1)).astype(np.int64)
+    print(f"signal-free fraction {mask.mean():.3f}, tops of lines in mask {np.count_nonzero(mask[tops])}")
+    assert 0.2 < mask.mean() < 1 and not mask[tops].any()
+    # full resolution and averaged in blocks of 64 points
+    for method, params in (("polynomial", ()), ("als", (100.0, 0.01, 10)), ("als", (100.0, 0.01, 10, 64)),
+                           ("whittaker", (1.0,)), ("whittaker", (1.0, 64))):
+        start = time.perf_counter()
+        residual = np.abs(compute_baseline(spectrum, method, *params) - 20*x_axis**2)[tops].max()
+        print(f"{method} {params}: max error of baseline under lines {residual:.2f}, "
+              f"{1000*(time.perf_counter() - start):.0f} ms")
+        assert residual < 5
+
+    # solver used without scipy has to give the same smoothed data
+    start = time.perf_counter()
+    scipy_linalg, installed = None, scipy_linalg
+    smoothed = whittaker_smooth(spectrum, mask.astype(np.double), 1.0)
+    scipy_linalg = installed
+    difference = np.abs(smoothed - compute_baseline(spectrum, "whittaker")).max()
+    print(f"without scipy: max difference {difference:.2e}, {1000*(time.perf_counter() - start):.0f} ms")
+    assert difference < 1e-2
@@ -0,0 +1,84 @@
+"""
+Loading of many experiments at once in a pool of worker processes
+"""
+import concurrent.futures
+import dataclasses
+
+from spectrum import Spectrum_1D
+
+
+@dataclasses.dataclass
+class LoadResult:
+    path : str # path as given to load_spectra
+    spectrum : Spectrum_1D # None if loading failed
+    error : Exception # None if loading succeeded
+
+
+def load_spectrum(path):
+    # executed in worker process, Spectrum_1D is pickled by its __getstate__
+    # so only arrays, SpectrumInfo and results of processing are sent back
+    return Spectrum_1D.create_from_file(path)
+
+def load_spectra(paths, workers=None, ordered=True):
+    """
+    Generator loading experiments in parallel, every experiment is read, 
+    decoded and processed into Spectrum_1D in worker process. 
+    On systems using spawn start method (Windows, macOS) it has to be called 
+    from code guarded by if __name__ == "__main__".
+
+    Parameters
+    ----------
+    paths : iterable of str
+        paths accepted by Spectrum_1D.create_from_file.
+    workers : int, optional
+        number of worker processes, default is number of processors,
+        0 loads everything in current process
+    ordered : bool, optional
+        if True results are yielded in order of paths, 
+        if False as soon as they are ready
+
+    Yields
+    ------
+    LoadResult
+        one for every path, errors are reported in it instead of being raised
+
+    """
+    paths = list(paths)
+    if workers == 0:
+        for path in paths:
+            try:
+                yield LoadResult(path, load_spectrum(path), None)
+            except Exception as error:
+                yield LoadResult(path, None, error)
+        return
+    
+    executor = concurrent.futures.ProcessPoolExecutor(max_workers=workers)
+    try:
+        futures = {executor.submit(load_spectrum, path) : path for path in paths}
+        done = futures if ordered else concurrent.futures.as_completed(futures)
+        for future in done:
+            error = future.exception()
+            yield LoadResult(futures[future], None if error else future.result(), error)
+    finally:
+        executor.shutdown(cancel_futures=True)
+
+
+if __name__ == "__main__":
+    import time
+    
+    spektra = ("./example_fids/agilent/agilent_example1H.fid/fid",
+    "./example_fids/agilent/agilent_example13C.fid/fid",
+    "./example_fids/agilent/agilent_example19F.fid/fid",
+    "./example_fids/agilent/agilent_example31P.fid/fid",
+    "./example_fids/bruker/1/fid",
+    "./example_fids/bruker/2/fid",
+    "./example_fids/bruker/3/fid",
+    "./example_fids/not_existing/fid")
+    
+    for workers in (0, None):
+        start = time.perf_counter()
+        for result in load_spectra(spektra * 4, workers=workers):
+            pass
+        print(f"workers {workers}: {time.perf_counter() - start:.2f} s")
+    for result in load_spectra(spektra, ordered=False):
+        print(result.path, repr(result.error) if result.error else result.spectrum.phase)
@@ -0,0 +1,335 @@
+"""
+Deconvolution of real spectra: fitting of sums of lines to regions.
+
+Models of lines (names used by fit_region and Spectrum_1D.deconvolve):
+    "lorentzian"   - height / (1 + (2*(x - position)/width)**2)
+    "gaussian"     - height * exp(-4*ln(2)*((x - position)/width)**2)
+    "pseudo_voigt" - height * ((1 - eta)*gaussian + eta*lorentzian) with the same width,
+                     eta from <0, 1> is fitted for every line
+width is full width at half height, heights are not negative (lines are picked peaks).
+Every region has also linear baseline.
+Parameters are fitted by Levenberg-Marquardt method with analytic jacobian computed
+for all lines and points at once. Regions are independent, so they are fitted
+in pool of worker processes, only short slices of spectrum are sent to workers.
+Positions and widths are in data points of spectrum, areas are in the same units
+as integrals of Spectrum_1D (processing.INTEGRATION_STEP per point).
+
+regions = regions_from_peaks(peaks, len(spectrum), hz_per_point)
+lines = convert_units(fit_regions(spectrum, regions, peaks, hz_per_point, "lorentzian"), info, len(spectrum))
+lines["ppm"], lines["width_ppm"], lines["area"]
+"""
+import concurrent.futures
+
+import numpy as np
+
+import processing
+
+LN2 = np.log(2)
+
+# unit area (in width units) of lines with unit height and width
+AREAS = {
+    "lorentzian" : np.pi / 2,
+    "gaussian" : np.sqrt(np.pi / (4*LN2)),
+    }
+
+LINE_TYPE = np.dtype([
+    ("region", np.int64), # number of region in which line was fitted
+    ("point", np.double), # [data points] position
+    ("ppm", np.double),
+    ("hz", np.double),
+    ("height", np.double),
+    ("width", np.double), # [data points] full width at half height
+    ("width_hz", np.double),
+    ("width_ppm", np.double),
+    ("eta", np.double), # fraction of lorentzian, 1 for lorentzian, 0 for gaussian
+    ("area", np.double), # in units of integrals of Spectrum_1D
+    ("rms", np.double), # root mean square of residuals of region
+    ])
+
+
+def lorentzian(x_axis, positions, widths):
+    """
+    Returns lorentzian lines with unit height and their derivatives by positions and widths,
+    as 2D arrays (one column per line)
+    """
+    u = 2*(x_axis[:, np.newaxis] - positions) / widths
+    shape = 1 / (1 + u*u)
+    squared = shape*shape
+    return shape, 4*u*squared / widths, 2*u*u*squared / widths
+
+def gaussian(x_axis, positions, widths):
+    # the same as lorentzian for gaussian lines
+    u = (x_axis[:, np.newaxis] - positions) / widths
+    shape = np.exp(-4*LN2*u*u)
+    return shape, 8*LN2*u*shape / widths, 8*LN2*u*u*shape / widths
+
+def line_count(params, model):
+    return (len(params) - 2) // (4 if model == "pseudo_voigt" else 3)
+
+def evaluate(x_axis, params, model):
+    """
+    Returns sum of lines and linear baseline and its jacobian (one column per parameter)
+
+    Parameters
+    ----------
+    x_axis : np.array
+        [data points] points in which lines are evaluated.
+    params : np.array
+        positions, heights, widths of all lines, (for pseudo_voigt also eta of all lines),
+        offset and slope of baseline (per half of x_axis range).
+    model : str
+        "lorentzian", "gaussian" or "pseudo_voigt".
+
+    Returns
+    -------
+    (np.array, np.array)
+        values and jacobian
+
+    """
+    count = line_count(params, model)
+    positions, heights, widths = params[:count], params[count:2*count], params[2*count:3*count]
+    if model == "pseudo_voigt":
+        eta = params[3*count:4*count]
+        lorentz = lorentzian(x_axis, positions, widths)
+        gauss = gaussian(x_axis, positions, widths)
+        shape, by_position, by_width = ((1 - eta)*g + eta*l for g, l in zip(gauss, lorentz))
+    elif model in AREAS:
+        shape, by_position, by_width = globals()[model](x_axis, positions, widths)
+    else:
+        raise NotImplementedError(f"not implemented line model {model}")
+
+    centre = (x_axis[0] + x_axis[-1]) / 2
+    scale = max((x_axis[-1] - x_axis[0]) / 2, 1)
+    slope_axis = (x_axis - centre) / scale
+    columns = [by_position*heights, shape, by_width*heights]
+    if model == "pseudo_voigt":
+        columns.append((lorentz[0] - gauss[0])*heights)
+    columns.append(np.ones((len(x_axis), 1)))
+    columns.append(slope_axis[:, np.newaxis])
+    values = shape @ heights + params[-2] + params[-1]*slope_axis
+    return values, np.hstack(columns)
+
+def constrain(params, model, x_axis):
+    # keeps lines inside region, heights not negative, widths positive and eta in <0, 1>
+    count = line_count(params, model)
+    params[:count] = np.clip(params[:count], x_axis[0], x_axis[-1])
+    params[count:2*count] = np.maximum(params[count:2*count], 0)
+    params[2*count:3*count] = np.clip(params[2*count:3*count], 0.5, len(x_axis))
+    if model == "pseudo_voigt":
+        params[3*count:4*count] = np.clip(params[3*count:4*count], 0, 1)
+    return params
+
+def levenberg_marquardt(x_axis, data, params, model, iterations=200, tolerance=1e-10):
+    """
+    Minimizes sum of squared residuals of evaluate(x_axis, params, model) from data,
+    returns fitted params and root mean square of residuals
+    """
+    params = constrain(np.array(params, dtype=np.double), model, x_axis)
+    values, jacobian = evaluate(x_axis, params, model)
+    residuals = values - data
+    cost = residuals @ residuals
+    damping = 1e-3
+    for _ in range(iterations):
+        normal = jacobian.T @ jacobian
+        gradient = jacobian.T @ residuals
+        diagonal = np.maximum(np.diag(normal), 1e-12)
+        try:
+            step = np.linalg.solve(normal + damping*np.diag(diagonal), -gradient)
+        except np.linalg.LinAlgError:
+            damping *= 10
+            continue
+        # lines move at most by their width in one step, so that they do not jump over each other
+        count = line_count(params, model)
+        widths = params[2*count:3*count]
+        step[:count] = np.clip(step[:count], -widths, widths)
+        step[2*count:3*count] = np.clip(step[2*count:3*count], -widths/2, widths)
+        trial = constrain(params + step, model, x_axis)
+        trial_values, trial_jacobian = evaluate(x_axis, trial, model)
+        trial_residuals = trial_values - data
+        trial_cost = trial_residuals @ trial_residuals
+        if trial_cost < cost:
+            converged = cost - trial_cost <= tolerance*cost
+            params, jacobian, residuals, cost = trial, trial_jacobian, trial_residuals, trial_cost
+            damping = max(damping / 3, 1e-9)
+            if converged:
+                break
+        else:
+            damping *= 2
+            if damping > 1e9:
+                break
+    return params, np.sqrt(cost / len(data))
+
+def fit_region(data, begin, positions, heights, widths, model="lorentzian"):
+    """
+    Fits lines to region of spectrum
+
+    Parameters
+    ----------
+    data : np.array
+        real spectrum of region.
+    begin : int
+        [data point] beginning of region in spectrum.
+    positions, heights, widths : np.array
+        [data points of spectrum] initial parameters of lines, e.g. from peak picking.
+    model : str
+        "lorentzian", "gaussian" or "pseudo_voigt".
+
+    Returns
+    -------
+    np.array of LINE_TYPE
+        fitted lines, region is -1, it is set by fit_regions,
+        fields in Hz and ppm are nan, they are set by convert_units
+
+    """
+    x_axis = np.arange(begin, begin + len(data), dtype=np.double)
+    count = len(positions)
+    params = [positions, heights, np.maximum(widths, 1.0)]
+    if model == "pseudo_voigt":
+        params.append(np.full(count, 0.5))
+    params.append([0.0, 0.0])
+    params = np.concatenate(params)
+    # heights and baseline are linear parameters, their least squares values for initial
+    # positions and widths are better start than heights of peaks, which overlap
+    _, jacobian = evaluate(x_axis, params, model)
+    linear = np.r_[count:2*count, -2, -1]
+    params[linear] = np.linalg.lstsq(jacobian[:, linear], data, rcond=None)[0]
+    params, rms = levenberg_marquardt(x_axis, data, params, model)
+
+    lines = np.empty(count, dtype=LINE_TYPE)
+    lines["region"] = -1
+    lines["point"] = params[:count]
+    lines["height"] = params[count:2*count]
+    lines["width"] = params[2*count:3*count]
+    if model == "pseudo_voigt":
+        lines["eta"] = params[3*count:4*count]
+        unit_area = (1 - lines["eta"])*AREAS["gaussian"] + lines["eta"]*AREAS["lorentzian"]
+    else:
+        lines["eta"] = 1.0 if model == "lorentzian" else 0.0
+        unit_area = AREAS[model]
+    lines["area"] = unit_area * lines["height"] * lines["width"] * processing.INTEGRATION_STEP
+    lines["rms"] = rms
+    for field in ("ppm", "hz", "width_hz", "width_ppm"):
+        lines[field] = np.nan
+    return lines
+
+def convert_units(lines, info, length):
+    # fills positions and widths of lines in ppm and Hz, the same conversion as of peak_picking
+    position = lines["point"] / length
+    lines["ppm"] = info.plot_end_ppm - position*(info.plot_end_ppm - info.plot_begin_ppm)
+    lines["hz"] = info.plot_end - position*(info.plot_end - info.plot_begin)
+    lines["width_hz"] = lines["width"] * (info.plot_end - info.plot_begin) / length
+    lines["width_ppm"] = lines["width"] * (info.plot_end_ppm - info.plot_begin_ppm) / length
+    return lines
+
+def peak_widths(peaks, hz_per_point):
+    """
+    Returns widths of peaks [data points] used as initial widths of lines,
+    half height of peak on tail of other line may be far or not reached at all,
+    so widths are limited to twice distance to the nearest peak
+    """
+    widths = peaks["width"] / hz_per_point
+    if len(peaks) > 1:
+        order = np.argsort(peaks["index"], kind="stable")
+        gaps = np.diff(peaks["index"][order]).astype(np.double)
+        nearest = np.minimum(np.append(np.inf, gaps), np.append(gaps, np.inf))
+        limit = np.empty(len(peaks))
+        limit[order] = 2*nearest
+        widths = np.minimum(widths, limit)
+    return np.maximum(widths, 1.0)
+
+def regions_from_peaks(peaks, length, hz_per_point, extent=4.0):
+    """
+    Groups peaks (np.array of peak_picking.PEAK_TYPE) into independent regions
+    for fitting, every peak covers extent widths (see peak_widths) on both sides,
+    overlapping peaks are in the same region.
+
+    Returns
+    -------
+    list of (int, int, np.array)
+        [data points] beginning and end of region and indices of peaks in it
+
+    """
+    if len(peaks) == 0:
+        return []
+    order = np.argsort(peaks["index"], kind="stable")
+    half = np.maximum(extent * peak_widths(peaks, hz_per_point)[order], 8)
+    begins = np.maximum(np.floor(peaks["index"][order] - half), 0).astype(np.int64)
+    ends = np.minimum(np.ceil(peaks["index"][order] + half) + 1, length).astype(np.int64)
+    # new region starts where coverage of all previous peaks ends
+    starts = np.flatnonzero(np.concatenate(([True], begins[1:] > np.maximum.accumulate(ends)[:-1])))
+    stops = np.append(starts[1:], len(order))
+    return [(int(begins[i]), int(ends[i:j].max()), order[i:j]) for i, j in zip(starts, stops)]
+
+def fit_regions(spectrum, regions, peaks, hz_per_point, model="lorentzian", workers=None):
+    """
+    Fits lines to every region in parallel
+
+    Parameters
+    ----------
+    spectrum : np.array
+        real spectrum.
+    regions : list of (int, int, np.array)
+        beginning and end of regions [data points] and indices of peaks
+        fitted in them, e.g. from regions_from_peaks.
+    peaks : np.array of peak_picking.PEAK_TYPE
+        initial lines, widths are limited by peak_widths.
+    hz_per_point : float
+        conversion of widths of peaks.
+    model : str
+        "lorentzian", "gaussian" or "pseudo_voigt".
+    workers : int, optional
+        number of worker processes, default is number of processors,
+        0 fits everything in current process.
+        On systems using spawn start method (Windows, macOS) it has to be called
+        from code guarded by if __name__ == "__main__".
+
+    Returns
+    -------
+    np.array of LINE_TYPE
+        fitted lines of all regions
+
+    """
+    widths = peak_widths(peaks, hz_per_point)
+    tasks = [(spectrum[begin:end], begin, peaks["index"][indices].astype(np.double),
+              peaks["height"][indices], widths[indices], model)
+             for begin, end, indices in regions]
+    if workers == 0 or len(tasks) < 2:
+        results = [fit_region(*task) for task in tasks]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(fit_region, *zip(*tasks), chunksize=max(len(tasks) // 64, 1)))
+    for i, lines in enumerate(results):
+        lines["region"] = i
+    return np.concatenate(results) if results else np.empty(0, dtype=LINE_TYPE)
+
+
+if __name__ == "__main__":
+    # accuracy and timing on synthetic spectrum with overlapping multiplets
+    import time
+
+    rng = np.random.default_rng(0)
+    length = 2**16
+    x_axis = np.arange(length)
+    positions = np.sort(rng.uniform(500, length - 500, 40))
+    positions = np.concatenate((positions, positions + rng.uniform(3, 10, 40))) # overlapping pairs
+    heights = rng.uniform(10, 100, len(positions))
+    widths = rng.uniform(3, 8, len(positions))
+    spectrum = rng.normal(size=length) + 5
+    for position, height, width in zip(positions, heights, widths):
+        spectrum += height / (1 + (2*(x_axis - position)/width)**2)
+    peaks = np.zeros(len(positions), dtype=[("index", np.int64), ("height", np.double), ("width", np.double)])
+    peaks["index"] = np.round(positions + rng.normal(0, 1, len(positions)))
+    peaks["height"] = spectrum[peaks["index"]]
+    peaks["width"] = 5.0
+    regions = regions_from_peaks(peaks, length, 1.0)
+    for workers in (0, None):
+        start = time.perf_counter()
+        lines = fit_regions(spectrum, regions, peaks, 1.0, workers=workers)
+        elapsed = time.perf_counter() - start
+        print(f"workers {workers}: {len(regions)} regions, {len(lines)} lines in {elapsed:.2f} s")
+    assert regions_from_peaks(peaks[:0], length, 1.0) == []
+    assert len(fit_regions(spectrum, [], peaks[:0], 1.0)) == 0
+    order = np.argsort(positions)
+    print("max error of position", np.abs(np.sort(lines["point"]) - positions[order]).max(),
+          "median relative error of area", np.median(np.abs(lines["area"][np.argsort(lines["point"])]
+          / (np.pi/2*heights*widths*processing.INTEGRATION_STEP)[order] - 1)))
@@ -4,7 +4,8 @@ import os
 
 import numpy as np
 
-from file_io.general import parse_by_specification, read_value, read_array
+from file_io.general import (parse_by_specification, read_value, open_binary, close_binary, 
+                             raw_dtype, complex_type, interleaved_to_complex)
 from spectrum_classes.spectrum_info import SpectrumInfo
 
 DEUTERIUM_EPSILON = 0.1535069
@@ -63,15 +64,58 @@ DataBlockHead = collections.namedtuple("DataBlockHead",
 # };
 # number - number of header in block
 
+# the same structure as numpy type, used to view all block headers at once
+DATA_BLOCK_HEAD_TYPE = np.dtype([
+    ("scale", ">i2"),
+    ("status", ">i2"),
+    ("index", ">i2"),
+    ("mode", ">i2"),
+    ("ctcount", ">i4"),
+    ("lpval", ">f4"),
+    ("rpval", ">f4"),
+    ("lvl", ">f4"),
+    ("tlt", ">f4"),
+    ])
 
-def agilent_wrapper(path):
+
+def agilent_wrapper(path, use_mmap=False):
     # agilent - file header size 32 bytes, block headers 28 bytes
-    fid_content, procpar_lines = open_experiment_folder_agilent(path)
+    fid_content, procpar_lines = open_experiment_folder_agilent(path, use_mmap)
     procpar = read_agilent_procpar(procpar_lines)
     info = info_agilent(procpar)
-    status_dict, headers, fid, file_header = read_agilent_fid(fid_content)
+    try:
+        status_dict, headers, fid, file_header = read_agilent_fid(fid_content)
+    finally:
+        # decoded fid is a copy, memory map is not needed any more
+        close_binary(fid_content)
     return info, fid
 
+def agilent_arrayed_wrapper(path):
+    # fid file of arrayed experiment is always memory mapped, blocks are decoded 
+    # one by one when generator (see iter_agilent_fid) is iterated, memory map is closed
+    # when generator is exhausted or closed (generator.close())
+    fid_content, procpar_lines = open_experiment_folder_agilent(path, True)
+    try:
+        info = info_agilent(read_agilent_procpar(procpar_lines))
+    except:
+        close_binary(fid_content)
+        raise
+    return info, iter_closing(iter_agilent_fid(fid_content), fid_content)
+
+def iter_closing(blocks, fid_content):
+    # generator of blocks, memory map is closed after blocks are no longer iterated,
+    # decoded blocks are copies, they stay valid
+    try:
+        yield from blocks
+    finally:
+        blocks.close()
+        close_binary(fid_content)
+
+def agilent_info_wrapper(path):
+    # only procpar is read, fid file is not opened
+    procpar = read_agilent_procpar(open_procpar_agilent(path))
+    return info_agilent(procpar)
+
 # def agilent_wrapper_with_header(path):
 #     # agilent - file header size 32 bytes, block headers 28 bytes
 #     fid_content, procpar_lines = open_experiment_folder_agilent(path)
@@ -80,8 +124,8 @@ def agilent_wrapper(path):
 #     status_dict, headers, fid, file_header = read_agilent_fid(fid_content)
 #     return info, fid, headers, file_header
 
-def read_agilent_fid(fid_content):
-    ptr = 0
+def read_agilent_header(fid_content):
+    # only first 32 bytes of fid_content are accessed
     file_header = DataFileHead(*struct.unpack(">llllllh2sl", fid_content[0:32]))
     status_dict = {
         's_data'         : bool(int(file_header.status[1] & int("00000001", 2))),
@@ -99,7 +143,65 @@ def read_agilent_fid(fid_content):
         's_ni'           : bool(int(file_header.status[0] & int("00100000", 2))),
         's_ni2'          : bool(int(file_header.status[0] & int("01000000", 2))),
         }
-    ptr += 32
+    return file_header, status_dict
+
+def read_agilent_fid(fid_content):
+    """
+    Decodes all blocks and traces of agilent fid file
+
+    Parameters
+    ----------
+    fid_content : bytes-like object
+        content of fid file, bytes or mmap.mmap
+
+    Returns
+    -------
+    status_dict : dict
+        decoded status bits of file header
+    headers : np.array of DATA_BLOCK_HEAD_TYPE
+        block headers, one per block, fields named as in DataBlockHead
+    fids : np.array
+        complex array of shape (nblocks*ntraces, np//2), row i*ntraces + j is trace j of block i
+    file_header : DataFileHead
+
+    """
+    file_header, status_dict, blocks, primary_type = agilent_fid_blocks(fid_content)
+    
+    fids = np.empty((len(blocks), file_header.ntraces, blocks["data"].shape[-1]//2), 
+                    dtype=complex_type(primary_type))
+    interleaved_to_complex(blocks["data"], fids.dtype, reverse=True, out=fids)
+    fids = fids.reshape(-1, fids.shape[-1])
+    
+    return status_dict, blocks["head"].copy(), fids, file_header
+
+def iter_agilent_fid(fid_content):
+    """
+    Generator decoding agilent fid file block by block, so that only one 
+    decoded block is kept in memory at given time. If fid_content is mmap.mmap
+    raw data is also loaded only block by block.
+
+    Parameters
+    ----------
+    fid_content : bytes-like object
+        content of fid file, bytes or mmap.mmap
+
+    Yields
+    ------
+    header : np.void of DATA_BLOCK_HEAD_TYPE
+        header of block
+    fids : np.array
+        complex array of shape (ntraces, np//2)
+
+    """
+    file_header, status_dict, blocks, primary_type = agilent_fid_blocks(fid_content)
+    el_type = complex_type(primary_type)
+    for block in blocks:
+        yield block["head"].copy(), interleaved_to_complex(block["data"], el_type, reverse=True)
+
+def agilent_fid_blocks(fid_content):
+    # returns structured view of all blocks of fid file: fields "head" and "data",
+    # nothing is decoded or copied
+    file_header, status_dict = read_agilent_header(fid_content)
     
     if ((not status_dict["s_data"]) or status_dict["s_spec"] or status_dict["s_hypercomplex"] or
         status_dict["s_secnd"] or status_dict["s_transf"] or status_dict["s_np"] or 
@@ -113,44 +215,43 @@ def read_agilent_fid(fid_content):
         
     #quadrature = True if status_dict["s_complex"] else False
     
-    quadrature = True
-    
-    el_number = file_header.np // 2 if quadrature else file_header.np
+    if file_header.nbheaders == 1:
+        pass
+    elif file_header.nbheaders == 2:
+        raise NotImplementedError("hypercmplxbhead")
+    else:
+        raise NotImplementedError("unexpected number of block headers")
     
-    fids = []
-    headers = []
+    if file_header.bbytes != 28 + file_header.ntraces*file_header.tbytes:
+        raise ValueError(f"inconsistent file header {file_header}")
     
-    if file_header.nblocks > 1:
-        raise NotImplementedError("two dimensional spectra")
-    for i1 in range(file_header.nblocks):
-        header = DataBlockHead(*struct.unpack(">hhhhlffff", fid_content[ptr:ptr+28]))
-        ptr += 28
-        headers.append(header)
-        if file_header.nbheaders == 1:
-            pass
-        elif file_header.nbheaders == 2:
-            raise NotImplementedError("hypercmplxbhead")
-        else:
-            raise NotImplementedError("unexpected number of block headers")
-        if file_header.ntraces > 1:
-            raise NotImplementedError("more then one trace per block")
-        for i3 in range(file_header.ntraces):
-            fid = read_array(fid_content, ptr, el_number, primary_type, quadrature, big_endian=True, reverse=True)
-        fids.append(fid)
-    
-    return status_dict, headers, fids, file_header
+    block_type = np.dtype({
+        "names" : ["head", "data"],
+        "formats" : [DATA_BLOCK_HEAD_TYPE, 
+                     (raw_dtype(primary_type, True), (file_header.ntraces, file_header.np))],
+        "offsets" : [0, 28],
+        "itemsize" : file_header.bbytes,
+        })
+    # acquisition may be stopped before all blocks are recorded
+    nblocks = min(file_header.nblocks, (len(fid_content) - 32) // file_header.bbytes)
+    blocks = np.frombuffer(fid_content, dtype=block_type, count=nblocks, offset=32)
+    return file_header, status_dict, blocks, primary_type
    
-def open_experiment_folder_agilent(path):
+def open_experiment_folder_agilent(path, use_mmap=False):
     fid_path = os.path.join(path, "fid")
+    # procpar first, so that memory map is not left open if it is missing
+    procpar_lines = open_procpar_agilent(path)
+    fid_content = open_binary(fid_path, use_mmap)
+    
+    return fid_content, procpar_lines
+
+def open_procpar_agilent(path):
     procpar_path = os.path.join(path,"procpar")
-    with open(fid_path, "rb") as file:
-        fid_content = file.read()
     procpar_lines = []
     with open(procpar_path, "r") as file:
         for line in file:
             procpar_lines.append(line)
-    
-    return fid_content, procpar_lines
+    return procpar_lines
 
 # def read_agilent_procpar(procpar_lines):
 #     params = dict()
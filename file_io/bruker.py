@@ -2,7 +2,8 @@ import os
 from dataclasses import dataclass
 import numpy as np
 
-from file_io.general import read_array
+from file_io.general import (read_array, open_binary, close_binary, raw_dtype, complex_type, 
+                             interleaved_to_complex, remove_group_delay)
 from spectrum_classes.spectrum_info import SpectrumInfo
 
 @dataclass
@@ -11,29 +12,45 @@ class FidInfo:
     data_type : object
     elements_number : int
 
-def open_experiment_folder_bruker(path):
+# fids in ser files are padded to multiple of 1024 bytes
+SER_ROW_ALIGNMENT = 1024
+
+def open_experiment_folder_bruker(path, use_mmap=False, data_file="fid"):
     # to be merged with agilent version into universal file opener
-    fid_path = os.path.join(path, "fid")
+    # data_file - "fid" or "ser"
+    fid_path = os.path.join(path, data_file)
+    # parameter files first, so that memory map is not left open if they are missing
+    acqus_lines, samplename = open_parameter_files_bruker(path)
+    fid_content = open_binary(fid_path, use_mmap)
+    return fid_content, acqus_lines, samplename
+
+def open_parameter_files_bruker(path):
     acqus_path = os.path.join(path,"acqus")
-    with open(fid_path, "rb") as file:
-        fid_content = file.read()
     acqus_lines = []
     with open(acqus_path, "r") as file:
         for line in file:
             acqus_lines.append(line)
-    subfolder_path = [i.path for i in os.scandir(path) if i.is_dir()][0]
-    subfolder_path = [i.path for i in os.scandir(subfolder_path) if i.is_dir()][0]
     samplename = ""
-    with open(os.path.join(subfolder_path, "title")) as file:
+    with open(title_path_bruker(path)) as file:
         for line in file:
             samplename += line.strip() + ' '
-    return fid_content, acqus_lines, samplename
+    return acqus_lines, samplename
 
-def bruker_wrapper(path):
-    fid_content, acqus_lines, samplename = open_experiment_folder_bruker(path)
+def title_path_bruker(path):
+    # title file in first processing folder (e.g. pdata/1/title)
+    subfolder_path = [i.path for i in os.scandir(path) if i.is_dir()][0]
+    subfolder_path = [i.path for i in os.scandir(subfolder_path) if i.is_dir()][0]
+    return os.path.join(subfolder_path, "title")
+
+def bruker_wrapper(path, use_mmap=False):
+    fid_content, acqus_lines, samplename = open_experiment_folder_bruker(path, use_mmap)
     params = read_bruker_acqus(acqus_lines)
     info, fid_info = bruker_info(params)
-    fid = read_bruker_fid(fid_content, info, fid_info)
+    try:
+        fid = read_bruker_fid(fid_content, info, fid_info)
+    finally:
+        # decoded fid is a copy, memory map is not needed any more
+        close_binary(fid_content)
     info.samplename = samplename
     return info, fid
 
@@ -42,8 +59,83 @@ def read_bruker_fid(fid_content, info, fid_info):
         
     fid = read_array(fid_content, 0, fid_info.elements_number, fid_info.data_type, 
                       quadrature, fid_info.big_endian, reverse=fid_info.big_endian)
-    fid = np.roll(fid, -int(info.group_delay))
-    return [fid]
+    return [remove_group_delay(fid, info.group_delay)]
+
+def bruker_info_wrapper(path):
+    # only acqus and title are read, fid and ser files are not opened
+    acqus_lines, samplename = open_parameter_files_bruker(path)
+    info, _ = bruker_info(read_bruker_acqus(acqus_lines))
+    info.samplename = samplename
+    return info
+
+def bruker_ser_wrapper(path):
+    # ser file is always memory mapped, rows are decoded when accessed,
+    # returned rows should be closed (BrukerSerRows.close or with statement)
+    with open(os.path.join(path, "acqu2s"), "r") as file:
+        params_indirect = read_bruker_acqus(file.readlines())
+    ser_content, acqus_lines, samplename = open_experiment_folder_bruker(path, True, "ser")
+    try:
+        params = read_bruker_acqus(acqus_lines)
+        info, fid_info = bruker_info(params)
+        info.samplename = samplename
+        return info, BrukerSerRows(ser_content, info, fid_info, int(params_indirect["$TD"]))
+    except:
+        close_binary(ser_content)
+        raise
+
+class BrukerSerRows:
+    """
+    Lazy sequence of fids stored in bruker ser file (2D or pseudo 2D experiment).
+    Rows are viewed at their offsets in ser file, indexing decodes only
+    selected rows, e.g. rows[37] decodes single fid, rows[10:20] ten of them.
+    Decoded rows are the same as fid returned by read_bruker_fid.
+    Memory map of ser file is closed by close, or at the end of with statement:
+    with bruker_ser_wrapper(path)[1] as rows: ...
+    """
+    def __init__(self, ser_content, info, fid_info, rows_number):
+        self.info = info
+        self.fid_info = fid_info
+        
+        row_size = 2*fid_info.elements_number*np.dtype(fid_info.data_type).itemsize
+        row_size = -(-row_size // SER_ROW_ALIGNMENT) * SER_ROW_ALIGNMENT
+        row_type = np.dtype({
+            "names" : ["data"],
+            "formats" : [(raw_dtype(fid_info.data_type, fid_info.big_endian), 
+                          (2*fid_info.elements_number,))],
+            "itemsize" : row_size,
+            })
+        # rows are padded to SER_ROW_ALIGNMENT, file of other size is not ser file of given 
+        # data type and number of points, it is not decoded into shifted garbage
+        if len(ser_content) % row_size:
+            raise ValueError(f"size of ser file {len(ser_content)} B is not multiple of row size {row_size} B")
+        # acquisition may be stopped before all rows are recorded
+        rows_number = min(rows_number, len(ser_content) // row_size)
+        self._content = ser_content
+        self._rows = np.frombuffer(ser_content, dtype=row_type, count=rows_number)
+    
+    def close(self):
+        # view of rows has to be released before memory map is closed, decoded rows are copies
+        self._rows = self._rows[:0].copy()
+        close_binary(self._content)
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+    
+    def __len__(self):
+        return len(self._rows)
+    
+    def __getitem__(self, index):
+        raw = self._rows["data"][index]
+        fid = interleaved_to_complex(raw, complex_type(self.fid_info.data_type), 
+                                     reverse=self.fid_info.big_endian)
+        return remove_group_delay(fid, self.info.group_delay)
+    
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
     
 # def read_bruker_acqus(acqus_lines):
 #     params = dict()
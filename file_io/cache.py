@@ -0,0 +1,139 @@
+import os
+import json
+import hashlib
+import dataclasses
+
+import numpy as np
+
+from spectrum_classes.spectrum_info import SpectrumInfo
+
+# part of key, changed when readers decode fids differently, so that old entries are not used
+# 2 - group delay is not removed by readers
+# 3 - integer part of group delay is removed by readers again
+# 4 - leading points are cut off and end is zero padded instead of roll
+CACHE_FORMAT = 4
+
+
+class FidCache:
+    """
+    On disk cache of decoded fids. Every entry is a pair of files:
+        <key>.npy - decoded fids as 2D array (one row per fid)
+        <key>.json - SpectrumInfo of experiment
+    key is built from absolute path, size and modification time of source file, 
+    the same of parameter files parsed by reader (procpar, acqus, title...) and CACHE_FORMAT,
+    so experiments with modified fid or parameters are decoded again. Total size of cache is limited to max_size,
+    least recently used entries are removed first.
+    Cached fids are loaded as copy-on-write memory maps, changing them never modifies cache.
+
+    cache = FidCache("path/to/cache")
+    info, fid = cache.open_experiment("path/to/experiment/fid")
+    """
+    def __init__(self, directory, max_size=2**30):
+        # max_size - [bytes] maximal size of all cached files
+        self.directory = os.path.abspath(directory)
+        self.max_size = max_size
+        os.makedirs(self.directory, exist_ok=True)
+
+    def key(self, path):
+        # imported here, readingfids imports file_io modules
+        from readingfids import parameter_files
+        
+        path = os.path.abspath(path)
+        identity = [path, str(CACHE_FORMAT)]
+        for file_path in [path] + parameter_files(path):
+            stat = os.stat(file_path)
+            identity += [file_path, str(stat.st_size), str(stat.st_mtime_ns)]
+        return hashlib.sha1("|".join(identity).encode()).hexdigest()
+
+    def get(self, path):
+        """
+        Returns (info, fid) of cached experiment, None if it is not cached
+        """
+        key = self.key(path)
+        fid_path = os.path.join(self.directory, key + ".npy")
+        info_path = os.path.join(self.directory, key + ".json")
+        try:
+            with open(info_path, "r") as file:
+                info = SpectrumInfo(**json.load(file))
+            fid = np.load(fid_path, mmap_mode="c")
+        except (OSError, ValueError):
+            return None
+        # modification time of info file is used as time of last access
+        os.utime(info_path)
+        return info, fid
+
+    def put(self, path, info, fid):
+        """
+        Stores decoded fid (list of fids or 2D array) and info of experiment at path,
+        fids which are not arrays (lazy BrukerSerRows) are not stored
+        """
+        if not isinstance(fid, (list, tuple, np.ndarray)):
+            return
+        fid = np.asarray(fid)
+        if fid.ndim == 1:
+            fid = fid[np.newaxis]
+        key = self.key(path)
+        fid_path = os.path.join(self.directory, key + ".npy")
+        info_path = os.path.join(self.directory, key + ".json")
+
+        # written to temporary files first, so that other processes never see incomplete entry
+        with open(fid_path + ".tmp", "wb") as file:
+            np.save(file, fid)
+        with open(info_path + ".tmp", "w") as file:
+            json.dump(dataclasses.asdict(info), file)
+        os.replace(fid_path + ".tmp", fid_path)
+        os.replace(info_path + ".tmp", info_path)
+
+        self.evict()
+
+    def open_experiment(self, path, use_mmap=False):
+        """
+        The same as readingfids.open_experiment, but fid is loaded from cache if possible
+        """
+        # imported here, readingfids imports file_io modules
+        from readingfids import open_experiment
+
+        cached = self.get(path)
+        if cached is not None:
+            return cached
+        info, fid = open_experiment(path, use_mmap)
+        self.put(path, info, fid)
+        return info, fid
+
+    def evict(self):
+        """
+        Removes least recently used entries until size of cache is not greater than max_size
+        """
+        entries = []
+        total_size = 0
+        for entry in os.scandir(self.directory):
+            key, ext = os.path.splitext(entry.name)
+            if ext != ".json":
+                continue
+            fid_path = os.path.join(self.directory, key + ".npy")
+            try:
+                size = entry.stat().st_size + os.path.getsize(fid_path)
+                entries.append((entry.stat().st_mtime_ns, size, key))
+            except OSError:
+                continue
+            total_size += size
+
+        entries.sort()
+        for _, size, key in entries:
+            if total_size <= self.max_size:
+                break
+            self.remove(key)
+            total_size -= size
+
+    def remove(self, key):
+        for ext in (".json", ".npy"):
+            try:
+                os.remove(os.path.join(self.directory, key + ext))
+            except FileNotFoundError:
+                pass
+
+    def clear(self):
+        for entry in os.scandir(self.directory):
+            key, ext = os.path.splitext(entry.name)
+            if ext in (".json", ".npy"):
+                self.remove(key)
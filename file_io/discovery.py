@@ -0,0 +1,123 @@
+import os
+from dataclasses import dataclass
+
+
+@dataclass
+class Experiment:
+    path : str # path to fid, ser or .jdf file, accepted by open_experiment
+    vendor : str # "agilent", "bruker", "bruker_ser" or "jdf", the same as fid_file_type
+    folder : str # folder in which experiment was found
+
+
+def classify_folder(folder, filenames):
+    """
+    Finds experiments stored directly in folder, classification is the same as
+    in readingfids.fid_file_type
+
+    Parameters
+    ----------
+    folder : str
+        path to folder.
+    filenames : set of str
+        names of files (not subfolders) in folder.
+
+    Returns
+    -------
+    list of Experiment
+
+    """
+    experiments = []
+    if "fid" in filenames:
+        if "procpar" in filenames:
+            experiments.append(Experiment(os.path.join(folder, "fid"), "agilent", folder))
+        elif "acqus" in filenames:
+            experiments.append(Experiment(os.path.join(folder, "fid"), "bruker", folder))
+    elif "ser" in filenames and "acqus" in filenames and "acqu2s" in filenames:
+        experiments.append(Experiment(os.path.join(folder, "ser"), "bruker_ser", folder))
+    for filename in sorted(filenames):
+        if os.path.splitext(filename)[1] == ".jdf":
+            experiments.append(Experiment(os.path.join(folder, filename), "jdf", folder))
+    return experiments
+
+
+class ExperimentIndex:
+    """
+    Index of all experiments in directory tree.
+    scan() walks tree with os.scandir, result of every folder is stored together
+    with its modification time, so next scan() lists again only folders whose
+    mtime has changed (files or subfolders were added, removed or renamed).
+
+    index = ExperimentIndex("path/to/data").scan()
+    for experiment in index.filter(vendor="bruker"):
+        info, fid = open_experiment(experiment.path)
+    """
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        # folder path -> (mtime_ns, list of Experiment, list of subfolder paths)
+        self._folders = {}
+
+    def scan(self):
+        visited = {}
+        stack = [self.root]
+        while stack:
+            folder = stack.pop()
+            try:
+                mtime = os.stat(folder).st_mtime_ns
+            except OSError:
+                continue
+            cached = self._folders.get(folder)
+            if cached is None or cached[0] != mtime:
+                cached = self._scan_folder(folder, mtime)
+            visited[folder] = cached
+            stack.extend(reversed(cached[2]))
+        # folders which were not visited do not exist anymore
+        self._folders = visited
+        return self
+
+    @staticmethod
+    def _scan_folder(folder, mtime):
+        filenames = set()
+        subfolders = []
+        try:
+            with os.scandir(folder) as entries:
+                for entry in entries:
+                    # symbolic links to folders are not followed, they could make loops
+                    if entry.is_dir(follow_symlinks=False):
+                        subfolders.append(entry.path)
+                    elif entry.is_file():
+                        filenames.add(entry.name)
+        except OSError:
+            return (mtime, [], [])
+        experiments = classify_folder(folder, filenames)
+        if any(experiment.vendor in ("bruker", "bruker_ser") for experiment in experiments):
+            # processed data of bruker experiment, it contains no fids
+            subfolders = [i for i in subfolders if os.path.basename(i) != "pdata"]
+        subfolders.sort()
+        return (mtime, experiments, subfolders)
+
+    def __iter__(self):
+        for folder in sorted(self._folders):
+            yield from self._folders[folder][1]
+
+    def __len__(self):
+        return sum(len(i[1]) for i in self._folders.values())
+
+    def filter(self, vendor=None, predicate=None):
+        """
+        Returns list of experiments of given vendor (str or tuple of str),
+        for which predicate(experiment) is True
+        """
+        if isinstance(vendor, str):
+            vendor = (vendor,)
+        return [i for i in self if (vendor is None or i.vendor in vendor)
+                and (predicate is None or predicate(i))]
+
+
+def scan_experiments(root):
+    return ExperimentIndex(root).scan()
+
+
+if __name__ == "__main__":
+    index = scan_experiments(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "example_fids"))
+    for experiment in index:
+        print(experiment.vendor, experiment.path)
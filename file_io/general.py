@@ -1,6 +1,8 @@
 import struct
 import collections
 import os
+import mmap
+import functools
 from dataclasses import dataclass
 import numpy as np
 
@@ -34,9 +36,6 @@ class SpectrumInfo:
     vendor : str # producer of spectrometer
 
 
-class EmptyClass:
-    pass
-
 specifiers = { # dictionary mapping types to python struct specifiers
     np.int8  : "b",
     np.int16 : "h",
@@ -96,26 +95,140 @@ types = {
     "float64" : np.double,
     }
 
-def parse_by_specification(buffer, start, big_endian, spec):
-    spec = spec.split()[1:]
-    parsed_file = EmptyClass()
+def open_binary(path, use_mmap=False):
+    """
+    Opens binary file for decoding
+
+    Parameters
+    ----------
+    path : str
+        path to file.
+    use_mmap : bool
+        if True file is not read, read only memory map of it is returned instead,
+        only pages of file which are accessed during decoding are loaded into memory.
+        Empty file is always read, it can not be memory mapped.
+
+    Returns
+    -------
+    bytes or mmap.mmap
+        content of file, both support slicing, struct.unpack_from and np.frombuffer.
+        Memory map keeps file open (and locked on Windows) until it is closed by close_binary,
+        all arrays viewing it have to be released before.
+
+    """
+    with open(path, "rb") as file:
+        if use_mmap and os.fstat(file.fileno()).st_size > 0:
+            return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        return file.read()
+
+def close_binary(content):
+    # closes memory map returned by open_binary, bytes need no closing
+    if isinstance(content, mmap.mmap):
+        content.close()
+
+def parse_by_specification(buffer, start, big_endian, spec, extra_fields=()):
+    """
+    Parses binary structure described by spec, spec is compiled once per 
+    (spec, big_endian, extra_fields) and whole structure is decoded by single unpack call
+
+    Parameters
+    ----------
+    buffer : bytes-like object
+        content of file.
+    start : int
+        position of structure in buffer.
+    big_endian : bool
+        True if binary is in big endian notation.
+    spec : str
+        csv-like description of structure, header line followed by lines:
+        group,position,type,array_size,name
+    extra_fields : tuple of str, optional
+        "group.name" attributes which are not read from buffer but will be set
+        later by caller, they are initialized to None
+
+    Returns
+    -------
+    parsed structure, values are accessible as parsed.group.name
+
+    """
+    return compile_specification(spec, big_endian, tuple(extra_fields)).parse(buffer, start)
+
+@functools.lru_cache(maxsize=None)
+def compile_specification(spec, big_endian, extra_fields=()):
+    return CompiledSpecification(spec, big_endian, extra_fields)
+
+class CompiledSpecification:
+    """
+    Binary structure description compiled into single struct.Struct and
+    classes with __slots__ for every group of values. 
+    Should be created by compile_specification, which caches instances.
+    """
+    def __init__(self, spec, big_endian, extra_fields=()):
+        fields = []
+        for line in spec.split()[1:]:
+            group, position, value_type, array_size, name = line.split(",")
+            fields.append((int(position), group, value_type, int(array_size), name))
+        fields.sort()
+        
+        struct_format = ">" if big_endian else "<"
+        self.fields = [] # (group, name, value_type, array_size, first item, last item)
+        ptr = 0
+        items = 0
+        for position, group, value_type, array_size, name in fields:
+            if position < ptr:
+                raise ValueError(f"field {group}.{name} overlaps previous field")
+            if position > ptr:
+                struct_format += f"{position - ptr}x"
+            
+            if value_type in ("string", "byte"):
+                size = max(array_size, 1)
+                struct_format += f"{size}s"
+                item_number = 1
+            else:
+                size = sizes[value_type] * max(array_size, 1)
+                struct_format += f"{max(array_size, 1)}{specifiers[value_type]}"
+                item_number = max(array_size, 1)
+            
+            self.fields.append((group, name, value_type, array_size, items, items + item_number))
+            items += item_number
+            ptr = position + size
+        self.struct = struct.Struct(struct_format)
+        
+        group_fields = {}
+        for group, name, *_ in self.fields:
+            group_fields.setdefault(group, []).append(name)
+        for field in extra_fields:
+            group, name = field.split(".")
+            group_fields.setdefault(group, []).append(name)
+        self.extra_fields = [field.split(".") for field in extra_fields]
+        
+        self.group_classes = {group : type(group, (), {"__slots__" : tuple(names)}) 
+                              for group, names in group_fields.items()}
+        self.parsed_class = type("ParsedStructure", (), {"__slots__" : tuple(group_fields)})
     
-    for line in spec:
-        line = line.split(",")
+    def parse(self, buffer, start):
+        values = self.struct.unpack_from(buffer, start)
         
-        group = line[0]
-        ptr = start + int(line[1])
-        value_type = line[2]
-        array_size = int(line[3])
-        name = line[4]
+        parsed = self.parsed_class()
+        for group, group_class in self.group_classes.items():
+            setattr(parsed, group, group_class())
         
-        if not hasattr(parsed_file, group):
-            setattr(parsed_file, group, EmptyClass())
-        group = getattr(parsed_file, group)
-        value = read_value(buffer, ptr, big_endian, value_type, array_size)
-        setattr(group, name, value)
+        for group, name, value_type, array_size, first, last in self.fields:
+            if value_type == "string":
+                value = decode_string(values[first])
+            elif value_type == "byte" or array_size == 0:
+                value = values[first]
+            else:
+                value = np.array(values[first:last], dtype=types[value_type])
+            setattr(getattr(parsed, group), name, value)
+            
+        for group, name in self.extra_fields:
+            setattr(getattr(parsed, group), name, None)
+        return parsed
 
-    return parsed_file
+def decode_string(value):
+    value = value.decode()
+    return value[:value.find("\x00")]
 
 def read_value(buffer, ptr, big_endian, value_type, array_size):
     endian = ">" if big_endian else "<"
@@ -124,8 +237,7 @@ def read_value(buffer, ptr, big_endian, value_type, array_size):
     if value_type == "string":
         specifier = endian + str(array_size) + "s"
         value = struct.unpack_from(specifier, buffer, ptr)[0]
-        value = value.decode()
-        value = value[:value.find("\x00")]
+        value = decode_string(value)
         # print(ptr, array_size, value_type, specifier, value)
         return value
     
@@ -149,7 +261,121 @@ def read_value(buffer, ptr, big_endian, value_type, array_size):
 
 def read_array(file_content, ptr, el_number, primary_type, complex_values, big_endian, reverse):
     """
-    Function to read a continous binary array of properties stated in parameters
+    Function to read a continous binary array of properties stated in parameters.
+    Raw data is viewed by np.frombuffer (no copy) and converted into result
+    array, which is the only allocation made.
+
+    Parameters
+    ----------
+    file_content : bytes-like object
+        content of file in which array is located, anything supporting buffer protocol
+        e.g. bytes, bytearray, mmap.mmap
+    ptr : positive integer
+        first byte of file part to be read.
+    el_number : positive integer
+        number of elements to be read, if it is an array of complex data points it is a number of complex data points not their components.
+    primary_type : numpy type class e.g. np.int32
+        type of simple elements e.g. if array contains complex numbers build from int32 components type is np.int32. If array is not of complex numbers it is simply type of elements
+    complex_values : bool
+        True if fid consists of array of complex numbers.
+    big_endian : bool
+        True if binary is in big endian notation.
+    reverse : bool
+        True if imaginary part is first, False if second.
+        only matters if complex_values==True
+
+    Raises
+    ------
+    NotImplementedError
+        error raised if there is no implemented processing for given fid type.
+
+    Returns
+    -------
+    np.array
+        extracted FID. type of elements can be deduced from table beneath the function definition
+
+    """
+    raw_type = raw_dtype(primary_type, big_endian)
+    
+    if not complex_values:
+        raw = np.frombuffer(file_content, dtype=raw_type, count=el_number, offset=ptr)
+        return raw.astype(raw_type.newbyteorder("="))
+    
+    raw = np.frombuffer(file_content, dtype=raw_type, count=2*el_number, offset=ptr)
+    return interleaved_to_complex(raw, complex_type(primary_type), reverse)
+
+def raw_dtype(primary_type, big_endian):
+    """
+    Returns numpy dtype with explicit byte order for given primary type
+    """
+    if primary_type not in sizes:
+        raise NotImplementedError(f"not implemented primary type{primary_type}")
+    return np.dtype(primary_type).newbyteorder(">" if big_endian else "<")
+
+def complex_type(primary_type):
+    """
+    Returns complex type used to store complex numbers build from primary_type components
+    """
+    primary_type = np.dtype(primary_type)
+    if primary_type in (np.uint8, np.uint16, np.uint32, np.uint64):
+        raise NotImplementedError("complex unsigned values not supported")
+    if primary_type in (np.int8, np.int16, np.int32, np.single):
+        return np.csingle
+    return np.cdouble
+
+def interleaved_to_complex(raw, el_type, reverse, out=None):
+    """
+    Converts array in which last axis contains interleaved components of complex numbers
+    into complex array. Components are taken as strided views of raw, so the only 
+    allocation is result array (none if out is given).
+
+    Parameters
+    ----------
+    raw : np.array
+        array of components, last axis has even length: re, im, re, im...
+        (im, re, im, re... if reverse)
+    el_type : numpy complex type
+        type of result
+    reverse : bool
+        True if imaginary part is first, False if second.
+    out : np.array, optional
+        array of shape raw.shape[:-1] + (raw.shape[-1]//2,) to which result is written
+
+    Returns
+    -------
+    np.array
+        complex array
+
+    """
+    if out is None:
+        out = np.empty(raw.shape[:-1] + (raw.shape[-1]//2,), dtype=el_type)
+    first = raw[..., 0::2]
+    second = raw[..., 1::2]
+    if reverse:
+        first, second = second, first
+    out.real = first
+    out.imag = second
+    return out
+
+def remove_group_delay(fid, points):
+    """
+    Returns fid, or 2D array of fids (one per row), shifted back by integer number of points 
+    delayed by digital filter. Leading points (filter pre-signal) are cut off 
+    and the end of fid is padded with zeros, so that length is kept and no pre-signal
+    is wrapped onto tail of fid, as it would be by np.roll.
+    Fractional part of group delay is corrected after fourier transform, see pipeline.DigitalFilter.
+    """
+    points = int(points)
+    if points <= 0:
+        return fid
+    result = np.zeros_like(fid)
+    result[..., :fid.shape[-1]-points] = fid[..., points:]
+    return result
+
+def read_array_reference(file_content, ptr, el_number, primary_type, complex_values, big_endian, reverse):
+    """
+    Reference implementation of read_array, decodes array element by element
+    with struct.unpack. Slow, kept to validate output of read_array.
 
     Parameters
     ----------
@@ -242,4 +468,4 @@ def read_array(file_content, ptr, el_number, primary_type, complex_values, big_e
 # False        | int32       int32       int64        single       double
 #              | ("h")       ("i")       ("q")        ("f")        ("d")
 
-#------------------------------------------------------------------------------
\ No newline at end of file
+#------------------------------------------------------------------------------
@@ -1,7 +1,11 @@
 import struct
+import collections.abc
+import functools
+
 import numpy as np
 
-from file_io.general import parse_by_specification, read_value, read_array, sizes
+from file_io.general import (parse_by_specification, read_array, sizes, open_binary, close_binary,
+                             decode_string, remove_group_delay)
 from spectrum_classes.spectrum_info import SpectrumInfo
 
 
@@ -51,6 +55,24 @@ file_info,1320,uint64,0,total_size
 axis_info,1328,uint32,8,unit_location
 """
 
+# attributes of header set in parse_jdf_header
+header_derived_fields = (
+    "file_info.big_endian",
+    "file_info.element_type",
+    "file_info.param_size",
+    "file_info.param_low_index",
+    "file_info.param_high_index",
+    "file_info.param_total_size",
+    "experiment_info.spectrum_type",
+    )
+
+param_header_spec = """group,position,type,array_size,name
+param_info,0,uint32,0,param_size
+param_info,4,uint32,0,param_low_index
+param_info,8,uint32,0,param_high_index
+param_info,12,uint32,0,param_total_size
+"""
+
 prefix_table = {
   -8: 'Yotta',
   -6: 'Exa',
@@ -129,7 +151,7 @@ def parse_jdf_header(file_content):
     if struct.unpack("8s", file_content[0:8])[0].decode() != "JEOL.NMR":
         raise TypeError("not a nmr file")
         
-    header = parse_by_specification(file_content, 0, True, spec)
+    header = parse_by_specification(file_content, 0, True, spec, header_derived_fields)
 
     header.file_info.big_endian = False if header.file_info.endian else True
     
@@ -148,14 +170,12 @@ def parse_jdf_header(file_content):
     if header.experiment_info.spectrum_type != "1D":
         raise NotImplementedError(" two dimensions")
     
-    header.file_info.param_size = read_value(file_content, header.file_info.param_start,
-                                                 header.file_info.big_endian, "uint32", 0)
-    header.file_info.param_low_index = read_value(file_content, header.file_info.param_start+4,
-                                                 header.file_info.big_endian, "uint32", 0)
-    header.file_info.param_high_index = read_value(file_content, header.file_info.param_start+8,
-                                                 header.file_info.big_endian, "uint32", 0)
-    header.file_info.param_total_size = read_value(file_content, header.file_info.param_start+12,
-                                                 header.file_info.big_endian, "uint32", 0)
+    param_header = parse_by_specification(file_content, header.file_info.param_start,
+                                          header.file_info.big_endian, param_header_spec)
+    header.file_info.param_size = param_header.param_info.param_size
+    header.file_info.param_low_index = param_header.param_info.param_low_index
+    header.file_info.param_high_index = param_header.param_info.param_high_index
+    header.file_info.param_total_size = param_header.param_info.param_total_size
     
     return header 
 
@@ -171,55 +191,75 @@ def parse_jdf_params(file_content, param_number, start, big_endian):
     # valuetype uint32
     # name string 28 bytes
     
-    ptr = start
-    params = {}
-    for i in range(param_number):
-        # print(i, ptr, end=", ")
-        scaler = read_value(file_content, ptr+4, big_endian, "uint16", 0)
-        # print(scaler, end=", ")
-        units = get_units(file_content, 5, ptr+6, big_endian)
-        # print(units, end=", ")
-        value_type = value_type_table[read_value(file_content, ptr+32, big_endian, "uint32", 0)]
-        # print(value_type, end=", ")
-        value_name = read_value(file_content, ptr+36, big_endian, "string", 28)
-        value_name = value_name[:value_name.find("\x00")]
-        value_name = value_name[:value_name.find(" ")]
-        # print(value_name, end=", ")
+    # params section is small, copy does not keep file (memory map) open
+    records = np.frombuffer(file_content, dtype=jdf_param_type(big_endian), 
+                            count=param_number, offset=start).copy()
+    return JdfParams(records, big_endian)
+
+@functools.lru_cache(maxsize=None)
+def jdf_param_type(big_endian):
+    # numpy type of single param record, value field is viewed as every possible type
+    endian = ">" if big_endian else "<"
+    return np.dtype({
+        "names" : ["scaler", "units", "value_bytes", "value_int", "value_float", 
+                   "value_float_second", "value_type", "name"],
+        "formats" : [endian + "u2", ("u1", (5, 2)), "V16", endian + "i4", endian + "f8", 
+                     endian + "f8", endian + "u4", "S28"],
+        "offsets" : [4, 6, 16, 16, 16, 24, 32, 36],
+        "itemsize" : 64,
+        })
+
+class JdfParams(collections.abc.Mapping):
+    """
+    Read only dictionary of jdf params: name -> (scaler, units, value).
+    Records are decoded in bulk into arrays, python objects are created 
+    only for params which are accessed.
+    """
+    def __init__(self, records, big_endian):
+        self.big_endian = big_endian
+        self._records = records
+        
+        # S28 type already ends names at first null byte
+        names = np.char.partition(records["name"], b" ")[:, 0]
+        # for repeated names last one is used
+        self._index = {name : i for i, name in enumerate(np.char.decode(names).tolist())}
+        
+        self._scaler = records["scaler"]
+        self._prefix = records["units"][:, :, 0] >> 4
+        self._power = records["units"][:, :, 0] & int("00001111", 2)
+        self._unit = records["units"][:, :, 1].view(np.int8)
+        self._value_type = records["value_type"]
+    
+    def __getitem__(self, name):
+        i = self._index[name]
+        units = [(prefix_table.get(prefix, "None"), power, unit_table[unit]) for prefix, power, unit 
+                 in zip(self._prefix[i].tolist(), self._power[i].tolist(), self._unit[i].tolist())]
+        return (int(self._scaler[i]), units, self._value(i))
+    
+    def __iter__(self):
+        return iter(self._index)
+    
+    def __len__(self):
+        return len(self._index)
+    
+    def _value(self, i):
+        record = self._records[i]
+        value_type = value_type_table[int(self._value_type[i])]
         if value_type == "String":
-            value = read_value(file_content, ptr+16, big_endian, "string", 16)
+            value = decode_string(record["value_bytes"].tobytes())
             value = value[:value.find("\x00")]
             value = value[:value.find("  ")]
         elif value_type == "Integer":
-            value = read_value(file_content, ptr+16, big_endian, "int32", 0)
+            value = int(record["value_int"])
         elif value_type == "Float":
-            value = read_value(file_content, ptr+16, big_endian, "float64", 0)
+            value = float(record["value_float"])
         elif value_type == "Complex":
-            a = read_value(file_content, ptr+16, big_endian, "float64", 0)
-            b = read_value(file_content, ptr+24, big_endian, "float64", 0)
-            value = b+a*1j if big_endian else a+b*1j
+            a = float(record["value_float"])
+            b = float(record["value_float_second"])
+            value = b+a*1j if self.big_endian else a+b*1j
         elif value_type == "Infinity":
-            value = read_value(file_content, ptr+16, big_endian, "int32", 0)
-        # print(value)
-        params[value_name] = (scaler, units, value)
-        ptr += 64
-    return params
-
-def get_units(file_content, number_of_units, start, big_endian):
-    ptr = start
-    unit_list = []
-    for i in range(number_of_units):
-        byte = read_value(file_content, ptr, big_endian, "byte", 0)
-        # prefix = prefix_table[int.from_bytes(byte[0:1] >> 4)]
-        
-        prefix = prefix_table.get(int.from_bytes(byte[0:1]) >> 4, "None")
-        
-        # power = int.from_bytes(byte[0:1] & int("00001111", 2))
-        power = int.from_bytes(byte[0:1]) & int("00001111", 2)
-
-        unit = unit_table[read_value(file_content, ptr+1, big_endian, "int8", 0)]
-        unit_list.append((prefix, power, unit))
-        ptr += 2
-    return unit_list
+            value = int(record["value_int"])
+        return value
 
 def jdf_info(params, header):
     
@@ -239,7 +279,7 @@ def jdf_info(params, header):
         obs_nucl_freq = params["X_FREQ"][2],
         dwell_time = params["x_acq_time"][2] / header.axis_info.element_number[0],
         frequency_increment = spectral_width / header.axis_info.element_number[0],
-        group_delay = 20, # TO BE DONE
+        group_delay = jdf_group_delay(params),
         trimmed = 10,
         vendor = "jeol",
         solvent = params["solvent"][2],
@@ -249,6 +289,25 @@ def jdf_info(params, header):
     
     return info
 
+def jdf_group_delay(params):
+    """
+    Returns group delay [points of fid] of digital filter computed from its decimation 
+    stages: parameter "orders" is number of stages followed by order of filter of every stage,
+    "factors" is decimation factor of every stage. Filter of stage k delays signal by 
+    (order - 1)/2 of its input points, point of fid is longer by product of factors
+    of stage k and all following stages. 0 if parameters are missing (no digital filter).
+    """
+    if "orders" not in params or "factors" not in params:
+        return 0
+    orders = [int(i) for i in str(params["orders"][2]).split()]
+    factors = [int(i) for i in str(params["factors"][2]).split()]
+    if len(orders) == len(factors) + 1:
+        orders = orders[1:]
+    delay = 0
+    for k, order in enumerate(orders):
+        delay += (order - 1) / (2*np.prod(factors[k:]))
+    return float(delay)
+
 def read_fid(file_content, header):
     print("data start", header.file_info.data_start)
     fid_real = read_array(file_content, header.file_info.data_start,
@@ -267,22 +326,27 @@ def read_fid(file_content, header):
     
     return (fid_real - fid_imag*1j)
 
-def jdf_wrapper(path):
-    with open(path, "rb") as file:
-        file_content = file.read()
-        
-    header = parse_jdf_header(file_content)
-    params = parse_jdf_params(file_content, header.file_info.param_high_index, 
-                              header.file_info.param_start+16, header.file_info.big_endian)
-    info = jdf_info(params, header)
-    fid = read_fid(file_content, header)
-    fid = np.roll(fid, -int(info.group_delay))
-    return info, [fid]
-        
+def jdf_wrapper(path, use_mmap=False):
+    file_content = open_binary(path, use_mmap)
+    try:
+        header = parse_jdf_header(file_content)
+        params = parse_jdf_params(file_content, header.file_info.param_high_index, 
+                                  header.file_info.param_start+16, header.file_info.big_endian)
+        info = jdf_info(params, header)
+        fid = read_fid(file_content, header)
+    finally:
+        # header, params and fid are copies, memory map is not needed any more
+        close_binary(file_content)
+    return info, [remove_group_delay(fid, info.group_delay)]
 
-        
-        
-        
-        
-        
-        
\ No newline at end of file
+def jdf_info_wrapper(path):
+    # file is memory mapped and only header and params are accessed,
+    # data section is never loaded
+    file_content = open_binary(path, use_mmap=True)
+    try:
+        header = parse_jdf_header(file_content)
+        params = parse_jdf_params(file_content, header.file_info.param_high_index, 
+                                  header.file_info.param_start+16, header.file_info.big_endian)
+        return jdf_info(params, header)
+    finally:
+        close_binary(file_content)
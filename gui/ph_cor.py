@@ -62,7 +62,18 @@ class PhaseCorrectionWindow(QWidget):
         self.slider_changed = {"PH0": self.ph0_changed,
                                "PH1": self.ph1_changed,
                                "Pivot \n [%]": self.pivot_changed,}
+        
+        # while slider is dragged only decimated preview is drawn, correction of full spectrum
+        # is applied when slider is released or nothing changes for a while
+        self.preview_phase = None
+        self.commit_timer = QtCore.QTimer(self)
+        self.commit_timer.setSingleShot(True)
+        self.commit_timer.setInterval(300)
+        self.commit_timer.timeout.connect(self.commit_phase)
+        
     def reset_phase(self):
+        self.commit_timer.stop()
+        self.preview_phase = None
         self.current_tab.experiment.set_phase(new_phase=None)
         self.phc_0.slider.slider.setValue(0)
         self.phc_0.input_field.setValue(0.0)
@@ -104,20 +115,43 @@ class PhaseCorrectionWindow(QWidget):
         self.current_tab.refresh()
         
         
-    def ph0_changed(self):
-            self.current_tab.experiment.set_phase(Phase(self.phc_0.value*2/360, None, None))
-            self.current_tab.refresh()
+    def ph0_changed(self, preview=False):
+            self.phase_changed(Phase(self.phc_0.value*2/360, None, None), preview)
 
-    def ph1_changed(self):
-            self.current_tab.experiment.set_phase(Phase(None, 
-                                self.phc_1.value*2/360, self.pivot.value/100))
-            self.current_tab.refresh()
+    def ph1_changed(self, preview=False):
+            self.phase_changed(Phase(None, self.phc_1.value*2/360, self.pivot.value/100), preview)
 
-    def pivot_changed(self):
+    def pivot_changed(self, preview=False):
             pass
         
+    def phase_changed(self, new_phase, preview):
+        """
+        applies new_phase to spectrum, if preview is True it is only drawn 
+        on decimated spectrum and applied after slider is released or after a while
+        """
+        experiment = self.current_tab.experiment
+        if self.preview_phase is not None:
+            new_phase = self.preview_phase.combined(new_phase)
+        if preview:
+            self.preview_phase = experiment.phase.combined(new_phase)
+            self.current_tab.preview(experiment.preview_phase(self.preview_phase, 
+                                                              self.current_tab.preview_points()))
+            self.commit_timer.start()
+        else:
+            self.preview_phase = None
+            self.commit_timer.stop()
+            experiment.set_phase(new_phase)
+            self.current_tab.refresh()
+            
+    def commit_phase(self):
+        # correction shown by preview is applied to full spectrum
+        self.commit_timer.stop()
+        if self.preview_phase is not None:
+            self.phase_changed(self.preview_phase, preview=False)
+        
     @QtCore.pyqtSlot(object)
     def change_active_spectrum(self, new_active_tab):        
+        self.commit_phase()
         self.current_tab = new_active_tab
         self.setWindowTitle(f"""Phase Correction: {self.current_tab.experiment.info["samplename"]}""")
         self.phc_0.slider.slider.setValue(int(self.current_tab.experiment.phase.ph0/2*360*100))
@@ -131,6 +165,7 @@ class PhaseCorrectionWindow(QWidget):
         # self.pivot.input_field.setText(format(self.current_tab.experiment.phase.pivot*100, "0.2f"))
         
     def closeEvent(self, event):
+        self.commit_phase()
         del self.current_tab.window().ph_cor_window
         super().closeEvent(event)
         
@@ -149,6 +184,7 @@ class SliderWithEditField(QWidget):
         self.slider = LabeledSlider(minimum, maximum, interval, 100)
         self.slider.slider.setValue(int(initial*100))
         self.slider.slider.sliderMoved.connect(self.sliderChanged)
+        self.slider.slider.sliderReleased.connect(self.sliderReleased)
         
         self.input_field = QSpinBoxWithSilentSetValue(parent=self)
         self.input_field.setRange(minimum, maximum)
@@ -175,12 +211,16 @@ class SliderWithEditField(QWidget):
     def sliderChanged(self, value):
         # print("S")
         value = value/100
-        self.input_field.setValue(value)
+        # silent, field would apply correction to full spectrum
+        self.input_field.SetValue(value)
         # self.input_field.setText(str(value))
         self.value = value
         # print(self.value)
         
-        self.parent.slider_changed[self.text_label.text()]()
+        self.parent.slider_changed[self.text_label.text()](preview=True)
+        
+    def sliderReleased(self):
+        self.parent.commit_phase()
     
     def inputFieldChanged(self):
         # print("F")
@@ -46,7 +46,6 @@ class ZeroFillingAndTruncatingWindow(QWidget):
         current_tab.window().tabs_frame.selectedSpectrumSignal.connect(self.change_active_spectrum)
         
         self.list_widget = QListWidget(self)
-        self.list_widget.addItems(POWERS_OF_TWO)
         self.list_widget.currentRowChanged.connect(self.changed_value)
         layout = QVBoxLayout()
         layout.addWidget(self.list_widget)
@@ -58,11 +57,21 @@ class ZeroFillingAndTruncatingWindow(QWidget):
     def change_active_spectrum(self, new_active_tab): 
         self.current_tab = new_active_tab
         self.setWindowTitle(f"""Zero Filling/Truncating: {self.current_tab.experiment.info["samplename"]}""")
-        self.list_widget.setCurrentRow(POWERS_OF_TWO.index(str(len(self.current_tab.experiment.spectrum))))        
+        # length of spectrum zero filled to fast size (see processing.next_fast_size) is not power of two,
+        # it is added to list on its place
+        length = len(self.current_tab.experiment.spectrum)
+        sizes = sorted(set(int(i) for i in POWERS_OF_TWO) | {length})
+        self.list_widget.blockSignals(True)
+        self.list_widget.clear()
+        self.list_widget.addItems([str(i) for i in sizes])
+        self.list_widget.setCurrentRow(sizes.index(length))
+        self.list_widget.blockSignals(False)
         
     @pyqtSlot(int)
     def changed_value(self, nrow):
-        new_value = POWERS_OF_TWO[nrow]
+        if nrow < 0:
+            return
+        new_value = self.list_widget.item(nrow).text()
         if int(new_value) > len(self.current_tab.experiment.spectrum):
             self.current_tab.experiment.restore_fid()
             self.current_tab.experiment.zero_to_number(int(new_value))
@@ -267,6 +267,19 @@ class spectrum_painter(QWidget):
         self.data = self.experiment.spectrum.copy()
         self.update()
         # self.mousePressEvent()
+        
+    def preview(self, data):
+        """
+        drawing data (e.g. decimated spectrum) instead of spectrum until next refresh
+        """
+        self.data = data
+        self.update()
+        
+    def preview_points(self):
+        """
+        number of points of whole spectrum needed to draw visible part with two points per pixel
+        """
+        return max(int(2*self.width() / (self.width_vis[1]-self.width_vis[0])), 1)
 
     def integration_marks(self, painter):
         """
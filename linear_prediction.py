@@ -0,0 +1,146 @@
+"""
+Linear prediction (LP) of fids.
+
+Point of fid is predicted as linear combination of order preceding points (forward
+prediction) or following points (backward prediction, forward prediction of reversed fid).
+Coefficients are least squares solution of prediction of points of fid itself,
+computed by SVD (np.linalg.pinv) for all fids of 2D array (one fid per row) at once.
+Roots of forward prediction polynomial outside unit circle (growing signals) are
+reflected into it, so that extrapolation does not diverge.
+
+extended = extend_forward(fids, 1024) # truncated fids
+rebuilt = rebuild_start(fids, 2) # distorted first points
+"""
+import numpy as np
+
+
+def lp_coefficients(fids, order, rcond=1e-8):
+    """
+    Returns coefficients of forward prediction: point n is predicted as
+    coefficients @ fid[n-order:n]
+
+    Parameters
+    ----------
+    fids : np.array
+        complex fid, or 2D array of fids, all points are used for fitting.
+    order : int
+        number of coefficients, should be greater than number of lines.
+    rcond : float
+        relative cutoff of small singular values, see np.linalg.pinv.
+
+    Returns
+    -------
+    np.array
+        coefficients of every fid, shape (..., order)
+
+    """
+    windows = np.lib.stride_tricks.sliding_window_view(fids, order + 1, axis=-1)
+    pseudo_inverse = np.linalg.pinv(windows[..., :order], rcond=rcond)
+    return np.einsum("...km,...m->...k", pseudo_inverse, windows[..., order])
+
+def poly_from_roots(roots):
+    # coefficients (ascending powers) of monic polynomials with given roots, shape (..., order)
+    coefficients = np.ones(roots.shape[:-1] + (1,), dtype=roots.dtype)
+    for i in range(roots.shape[-1]):
+        new = np.zeros(roots.shape[:-1] + (i + 2,), dtype=roots.dtype)
+        new[..., 1:] += coefficients
+        new[..., :-1] -= roots[..., i, np.newaxis]*coefficients
+        coefficients = new
+    return coefficients
+
+def stabilize(coefficients):
+    """
+    Reflects roots of prediction polynomial z**order - sum(coefficients[k] z**k)
+    with magnitude greater than one into unit circle, so that predicted signals decay
+    """
+    order = coefficients.shape[-1]
+    # roots are eigenvalues of companion matrices
+    companion = np.zeros(coefficients.shape[:-1] + (order, order), dtype=np.cdouble)
+    companion[..., np.arange(1, order), np.arange(order - 1)] = 1
+    companion[..., :, -1] = coefficients
+    roots = np.linalg.eigvals(companion)
+    magnitude = np.abs(roots)
+    roots = np.where(magnitude > 1, roots / np.where(magnitude > 1, magnitude*magnitude, 1), roots)
+    return -poly_from_roots(roots)[..., :order]
+
+def predict_forward(fids, count, order=32, points=None, stable=True):
+    """
+    Predicts count points following fids
+
+    Parameters
+    ----------
+    fids : np.array
+        complex fid, or 2D array of fids.
+    count : int
+        number of predicted points.
+    order : int
+        number of LP coefficients.
+    points : int
+        number of last points of fids used for fitting, default is 16*order.
+    stable : bool
+        if True roots of prediction polynomials are reflected into unit circle.
+
+    Returns
+    -------
+    np.array
+        predicted points, shape (..., count)
+
+    """
+    if points is None:
+        points = 16*order
+    points = min(points, fids.shape[-1])
+    order = min(order, points // 2)
+    coefficients = lp_coefficients(fids[..., -points:], order)
+    if stable:
+        coefficients = stabilize(coefficients)
+    result = np.empty(fids.shape[:-1] + (order + count,), dtype=np.result_type(fids, np.csingle))
+    result[..., :order] = fids[..., fids.shape[-1]-order:]
+    # every point depends on previous ones, loop goes over points, all fids are predicted at once
+    for i in range(count):
+        result[..., order+i] = np.einsum("...k,...k->...", result[..., i:i+order], coefficients)
+    return result[..., order:]
+
+def predict_backward(fids, count, order=32, points=None):
+    """
+    Predicts count points preceding fids, using first points points,
+    parameters are the same as of predict_forward. Roots are not stabilized,
+    going backward signals grow.
+    """
+    return predict_forward(fids[..., ::-1], count, order, points, stable=False)[..., ::-1]
+
+def extend_forward(fids, count, order=32, points=None):
+    # fids extended by count predicted points, e.g. truncated fids
+    return np.concatenate((fids, predict_forward(fids, count, order, points)), axis=-1)
+
+def rebuild_start(fids, count, order=32, points=None):
+    # fids in which first count points are replaced by backward prediction from following points
+    result = fids.copy()
+    result[..., :count] = predict_backward(fids[..., count:], count, order, points)
+    return result
+
+
+if __name__ == "__main__":
+    # accuracy and timing on batch of synthetic fids
+    import time
+
+    rng = np.random.default_rng(0)
+    count, length, lines = 100, 1024, 8 # truncated fids
+    time_axis = np.arange(2*length)
+    frequencies = rng.uniform(-0.5, 0.5, (count, lines, 1))
+    decays = rng.uniform(1/4000, 1/500, (count, lines, 1))
+    exact = np.sum(rng.uniform(0.5, 2, (count, lines, 1)) * np.exp((2j*np.pi*frequencies - decays)*time_axis), axis=1)
+    fids = exact[:, :length] + 0.01*(rng.normal(size=(count, length)) + 1j*rng.normal(size=(count, length)))
+
+    start = time.perf_counter()
+    extended = extend_forward(fids, length)
+    elapsed = time.perf_counter() - start
+    error = np.median(np.abs(extended[:, length:] - exact[:, length:length*2]).max(axis=1) / np.abs(exact[:, length:]).max(axis=1))
+    print(f"forward {length} points of {count} fids: {1000*elapsed:.0f} ms, median relative error {error:.4f}")
+
+    damaged = fids.copy()
+    damaged[:, :4] = 0
+    start = time.perf_counter()
+    rebuilt = rebuild_start(damaged, 4)
+    elapsed = time.perf_counter() - start
+    error = np.median(np.abs(rebuilt[:, :4] - exact[:, :4]).max(axis=1) / np.abs(exact[:, :4]).max(axis=1))
+    print(f"backward 4 points of {count} fids: {1000*elapsed:.0f} ms, median relative error {error:.4f}")
@@ -0,0 +1,178 @@
+"""
+Automatic peak picking on real spectra.
+
+Peaks are local maxima higher than threshold derived from noise, which are also
+maxima within minimal separation from both sides and rise above noise near them. Position and height are
+refined by parabola through three highest points, width is full width at half height
+with linear interpolation between points. Every step is vectorized over all candidates.
+
+peaks = pick_peaks(spectrum, info)
+peaks["ppm"], peaks["height"]
+"""
+import numpy as np
+
+import noise
+
+PEAK_TYPE = np.dtype([
+    ("index", np.int64), # number of data point of maximum
+    ("position", np.double), # [fraction of spectrum] 0 - left edge, 1 - right edge
+    ("ppm", np.double),
+    ("hz", np.double),
+    ("height", np.double),
+    ("width", np.double), # [Hz] full width at half height
+    ("snr", np.double), # signal to noise ratio
+    ])
+
+def local_maxima(spectrum, threshold):
+    # indices of points higher than threshold and than left neighbour, not lower than right one
+    middle = spectrum[1:-1]
+    is_maximum = (middle > spectrum[:-2]) & (middle >= spectrum[2:]) & (middle > threshold)
+    return np.flatnonzero(is_maximum) + 1
+
+def separated_maxima(spectrum, indices, distance, prominence, prominence_distance):
+    """
+    Keeps only maxima which are the highest points within distance points from both sides
+    (from equal maxima the left one is kept) and which are higher by prominence
+    than the lowest point within prominence_distance on both sides, 
+    so that noise on slopes of lines is skipped
+    """
+    if len(indices) == 0:
+        return indices
+    distance = max(distance, 1)
+    width = max(distance, prominence_distance)
+    windows = np.lib.stride_tricks.sliding_window_view(
+        np.pad(spectrum, width, mode="edge"), 2*width + 1)[indices]
+    heights = spectrum[indices]
+    left = windows[:, width-distance:width]
+    right = windows[:, width+1:width+distance+1]
+    highest = (heights > left.max(axis=1)) & (heights >= right.max(axis=1))
+    lowest = np.maximum(windows[:, :width].min(axis=1), windows[:, width+1:].min(axis=1))
+    return indices[highest & (heights - lowest >= prominence)]
+
+def parabolic_interpolation(spectrum, indices):
+    """
+    Returns positions [data points] and heights of tops of parabolas
+    going through maxima and their neighbours
+    """
+    left = spectrum[indices - 1]
+    centre = spectrum[indices]
+    right = spectrum[indices + 1]
+    curvature = left - 2*centre + right
+    shift = np.where(curvature < 0, 0.5*(left - right) / np.where(curvature < 0, curvature, -1), 0)
+    return indices + shift, centre - 0.25*(left - right)*shift
+
+def half_widths(spectrum, indices, heights, block=64):
+    """
+    Returns distances [data points] from maxima to points at half of their heights
+    on left and right side, interpolated linearly between points.
+    Points are checked in blocks of block distances from maxima for all peaks at once,
+    edge of spectrum ends search.
+    """
+    half = heights / 2
+    widths = np.zeros((2, len(indices)))
+    offsets = np.arange(1, block + 1)
+    for side, direction in enumerate((-1, 1)):
+        active = np.arange(len(indices))
+        start = 0
+        while len(active):
+            positions = indices[active, np.newaxis] + direction*(start + offsets)
+            outside = (positions < 0) | (positions >= len(spectrum))
+            values = spectrum[np.clip(positions, 0, len(spectrum) - 1)]
+            below = (values <= half[active, np.newaxis]) | outside
+            found = below.any(axis=1)
+            rows = np.flatnonzero(found)
+            first = below[rows].argmax(axis=1)
+            current = values[rows, first]
+            previous = spectrum[positions[rows, first] - direction]
+            step = previous - current
+            fraction = np.where(step > 0, (previous - half[active[rows]]) / np.where(step > 0, step, 1), 1)
+            fraction[outside[rows, first]] = 0
+            widths[side, active[rows]] = start + first + fraction
+            active = active[~found]
+            start += block
+    return widths
+
+def pick_peaks(spectrum, info, threshold=None, snr=10.0, separation=None, prominence=None,
+               noise_level=None):
+    """
+    Finds peaks in real spectrum
+
+    Parameters
+    ----------
+    spectrum : np.array
+        real spectrum (phased, baseline corrected).
+    info : SpectrumInfo
+        information about spectrum, used for conversion of positions.
+    threshold : float
+        minimal height of peak, if None it is snr times noise level.
+    snr : float
+        minimal signal to noise ratio, used if threshold is None.
+    prominence : float
+        minimal rise of peak above the lowest point within 4 separations on both sides,
+        if None it is 0.8 of threshold, so that noise on tails of strong lines is not picked.
+    separation : float
+        [Hz] minimal distance of peaks, default is frequency_increment -
+        distance of points of spectrum without zero filling.
+    noise_level : float
+        standard deviation of noise, if None it is estimated by noise.estimate_noise.
+
+    Returns
+    -------
+    np.array of PEAK_TYPE
+        peaks ordered from left edge of spectrum
+
+    """
+    length = len(spectrum)
+    hz_per_point = (info.plot_end - info.plot_begin) / length
+    if separation is None:
+        separation = info.frequency_increment
+    distance = int(separation / hz_per_point)
+    if noise_level is None:
+        # noise of zero filled spectrum is correlated within resolution of fid
+        noise_level = noise.estimate_noise(spectrum, correlation=max(info.frequency_increment / hz_per_point, 1))
+    if threshold is None:
+        threshold = snr * noise_level
+    if prominence is None:
+        prominence = 0.8 * threshold
+
+    indices = local_maxima(spectrum, threshold)
+    indices = separated_maxima(spectrum, indices, distance, prominence, 4*distance)
+    positions, heights = parabolic_interpolation(spectrum, indices)
+
+    peaks = np.empty(len(indices), dtype=PEAK_TYPE)
+    peaks["index"] = indices
+    peaks["position"] = positions / length
+    peaks["ppm"] = info.plot_end_ppm - peaks["position"]*(info.plot_end_ppm - info.plot_begin_ppm)
+    peaks["hz"] = info.plot_end - peaks["position"]*(info.plot_end - info.plot_begin)
+    peaks["height"] = heights
+    peaks["width"] = half_widths(spectrum, indices, heights).sum(axis=0) * hz_per_point
+    peaks["snr"] = noise.snr(heights, noise_level)
+    return peaks
+
+
+if __name__ == "__main__":
+    # timing on synthetic spectrum: fid of 2**16 points with 200 lines, zero filled to 2**20 points
+    import time
+    import processing
+    from spectrum_classes.spectrum_info import SpectrumInfo
+
+    fid_length, length = 2**16, 2**20
+    rng = np.random.default_rng(0)
+    frequencies = rng.uniform(-0.45, 0.45, 200) # [fraction of spectral width]
+    time_axis = np.arange(fid_length)
+    fid = rng.normal(size=fid_length) + 1j*rng.normal(size=fid_length)
+    for frequency, amplitude in zip(frequencies, rng.uniform(0.5, 20, len(frequencies))):
+        fid += amplitude * np.exp((2j*np.pi*frequency - 1/5000) * time_axis)
+    spectrum = np.real(processing.fourier_transform(processing.zero_fill_to_number(fid, length)))
+    info = SpectrumInfo(plot_begin=0.0, plot_end=float(length), plot_begin_ppm=0.0, plot_end_ppm=10.0,
+                        spectral_width=float(length), acquisition_time=1.0, obs_nucl_freq=100.0,
+                        dwell_time=1/length, frequency_increment=length/fid_length, group_delay=0, 
+                        trimmed=0, vendor="", solvent="", samplename="", nucleus="")
+    start = time.perf_counter()
+    peaks = pick_peaks(spectrum, info)
+    elapsed = time.perf_counter() - start
+    # lines are at positions 0.5 - frequency, because spectrum is displayed from higher frequency
+    found = np.abs(peaks["position"][:, np.newaxis] - (0.5 - frequencies)).min(axis=0) < 1e-4
+    print(f"{len(peaks)} peaks, {np.count_nonzero(found)} of {len(frequencies)} lines found "
+          f"in {1000*elapsed:.1f} ms, lowest snr {peaks['snr'].min():.1f}, median width {np.median(peaks['width']):.1f} Hz "
+          f"(expected {length/fid_length/5000/np.pi*fid_length:.1f} Hz)")
@@ -0,0 +1,289 @@
+"""
+Automatic phase correction of complex spectra.
+
+Phase correction is found as minimum of objective function of real part of
+phased spectrum. For given first order correction ph1 good zero order correction ph0
+is computed in closed form (optimal_ph0), so coarse grid covers only ph1: objectives of
+whole grid are computed at once as 2D array (one phased spectrum per row,
+real part of spectrum phased by angle phi is real*cos(phi) - imag*sin(phi)).
+The best point is refined by compass search of objective in ph0 and ph1.
+Search may use decimated spectrum, final refinement always uses full spectrum.
+All phases are in units of pi, the same as in processing.phase_correction.
+
+ph0, ph1 = auto_phase(complex_spectrum, pivot=0.5)
+"""
+import time
+
+import numpy as np
+
+import processing
+
+
+def entropy_objective(real, penalty=1000.0):
+    """
+    Entropy of first derivative of spectrum with penalty for negative values (ACME),
+    it is minimal for absorption lines with flat baseline
+
+    Parameters
+    ----------
+    real : np.array
+        real part of spectrum, or 2D array with one spectrum per row.
+    penalty : float
+        weight of negative_objective.
+
+    Returns
+    -------
+    float or np.array
+        value for every spectrum
+
+    """
+    derivative = np.abs(np.diff(real, axis=-1))
+    total = derivative.sum(axis=-1, keepdims=True)
+    probability = derivative / np.where(total > 0, total, 1)
+    entropy = -np.sum(probability*np.log(np.where(probability > 0, probability, 1)), axis=-1)
+    return entropy + penalty*negative_objective(real)
+
+def negative_objective(real):
+    # fraction of power of spectrum which is in negative points, 0 for purely positive spectrum
+    power = np.sum(real*real, axis=-1)
+    negative = np.minimum(real, 0)
+    return np.sum(negative*negative, axis=-1) / np.where(power > 0, power, 1)
+
+# [pi] initial step of refinement of ph0 from closed form starting point
+PH0_STEP = 0.05
+
+OBJECTIVES = {
+    "entropy" : entropy_objective,
+    "negative" : negative_objective,
+    }
+
+def phased_real(spectrum, x_axis, ph0, ph1):
+    """
+    Returns real parts of spectrum phased by every pair of ph0, ph1 [pi] (1D arrays
+    of the same length) as 2D array, x_axis is from processing.phase_ramp
+    """
+    angle = np.pi*(ph0[:, np.newaxis] + ph1[:, np.newaxis]*x_axis)
+    return spectrum.real*np.cos(angle) - spectrum.imag*np.sin(angle)
+
+def evaluate(objective, spectrum, x_axis, ph0, ph1, chunk_size=2**22):
+    """
+    Returns values of objective for every pair of ph0, ph1, phased spectra are computed
+    in chunks of at most chunk_size points, so that memory use is limited
+    """
+    ph0, ph1 = np.broadcast_arrays(np.atleast_1d(ph0), np.atleast_1d(ph1))
+    rows = max(chunk_size // len(spectrum), 1)
+    scores = np.empty(len(ph0))
+    for i in range(0, len(ph0), rows):
+        scores[i:i+rows] = objective(phased_real(spectrum, x_axis, ph0[i:i+rows], ph1[i:i+rows]))
+    return scores
+
+def decimate(spectrum, x_axis, factor):
+    """
+    Returns shorter spectrum and its x_axis, from every block of factor points
+    point with maximal magnitude is kept, so that tops of narrow lines are not lost
+    """
+    length = len(spectrum) // factor * factor
+    blocks = np.abs(spectrum[:length]).reshape(-1, factor)
+    indices = blocks.argmax(axis=1) + np.arange(0, length, factor)
+    return spectrum[indices], x_axis[indices]
+
+def optimal_ph0(spectrum, x_axis, ph1, chunk_size=2**22):
+    """
+    Returns zero order corrections [pi] for every first order correction ph1 (1D array),
+    which maximize integral of real part of spectrum weighted by magnitude:
+    sum(|S| real(S exp(i pi (ph0 + ph1 x)))) is maximal for ph0 = -angle(sum(|S| S exp(i pi ph1 x))) / pi,
+    weights suppress contribution of noise and baseline
+    """
+    ph1 = np.atleast_1d(ph1)
+    weighted = np.abs(spectrum)*spectrum
+    rows = max(chunk_size // len(spectrum), 1)
+    sums = np.empty(len(ph1), dtype=np.cdouble)
+    for i in range(0, len(ph1), rows):
+        sums[i:i+rows] = np.exp(1j*np.pi*ph1[i:i+rows, np.newaxis]*x_axis) @ weighted
+    return -np.angle(sums) / np.pi
+
+def compass_search(function, start, steps, precision):
+    """
+    Minimizes function of point (np.array -> np.array of values for 2D array of points).
+    All points moved by +-step along every coordinate are evaluated at once,
+    if none of them is better, steps are halved until they are smaller than precision.
+    """
+    point = np.array(start, dtype=np.double)
+    steps = np.array(steps, dtype=np.double)
+    best = function(point[np.newaxis])[0]
+    directions = np.concatenate((np.eye(len(point)), -np.eye(len(point))))
+    while steps.max() >= precision:
+        candidates = point + directions*np.tile(steps, 2)[:, np.newaxis]
+        values = function(candidates)
+        i = np.argmin(values)
+        if values[i] < best:
+            point, best = candidates[i], values[i]
+        else:
+            steps /= 2
+    return point
+
+def auto_phase(spectrum, pivot=0.5, objective="entropy", first_order=True, ph1=0.0,
+               ph1_range=0.5, grid_size=11, decimation=1, precision=1e-3):
+    """
+    Finds phase correction of complex spectrum
+
+    Parameters
+    ----------
+    spectrum : np.array
+        complex spectrum without phase correction.
+    pivot : float
+        [fraction of spectrum] point in which first order correction is zero.
+    objective : str
+        name of objective function from OBJECTIVES.
+    first_order : bool
+        if False only ph0 is optimized and ph1 is kept.
+    ph1 : float
+        [pi] initial first order correction.
+    ph1_range : float
+        [pi] first order correction is searched in ph1 +- ph1_range.
+    grid_size : int
+        number of points of coarse grid of ph1.
+    decimation : int
+        if greater than 1 coarse search uses spectrum shorter by this factor (see decimate)
+        and only final refinement uses full spectrum. Faster for long spectra, but objective
+        depends on resolution, so for spectra with lines of few points ph1 may end
+        in different minimum than search of full spectrum.
+    precision : float
+        [pi] precision of refinement.
+
+    Returns
+    -------
+    (float, float)
+        [pi] ph0 from range <0, 2) and ph1
+
+    """
+    function = OBJECTIVES[objective]
+    x_axis = processing.phase_ramp(len(spectrum), pivot)
+    centre = ph1
+
+    def refine(spectrum, x_axis, start, steps):
+        # compass search of ph0 and ph1 (if first_order) minimizing objective
+        if not first_order:
+            ph0, = compass_search(lambda points : evaluate(function, spectrum, x_axis, points[:, 0], centre),
+                                  start[:1], steps[:1], precision)
+            return ph0, centre
+        def score(points):
+            # objective is infinite outside of searched range of ph1,
+            # ph1 of spectra with few lines is badly determined and search would drift away
+            values = np.full(len(points), np.inf)
+            inside = np.flatnonzero(np.abs(points[:, 1] - centre) <= ph1_range + 1e-12)
+            values[inside] = evaluate(function, spectrum, x_axis, points[inside, 0], points[inside, 1])
+            return values
+        return compass_search(score, start, steps, precision)
+
+    full_spectrum, full_x_axis = spectrum, x_axis
+    if decimation > 1:
+        spectrum, x_axis = decimate(spectrum, x_axis, decimation)
+    # closed form ph0 is starting point, it is close to minimum of objective,
+    # so only ph1 needs coarse grid
+    steps = (PH0_STEP, ph1_range / max(grid_size - 1, 1))
+    if first_order:
+        grid = ph1 + np.linspace(-ph1_range, ph1_range, grid_size)
+        ph0_grid = optimal_ph0(spectrum, x_axis, grid)
+        best = np.argmin(evaluate(function, spectrum, x_axis, ph0_grid, grid))
+        start = (ph0_grid[best], grid[best])
+    else:
+        start = (optimal_ph0(spectrum, x_axis, ph1)[0], ph1)
+    ph0, ph1 = refine(spectrum, x_axis, start, steps)
+    if decimation > 1:
+        # final refinement starts with the same steps, so that it reaches minimum
+        # of full spectrum even if it is moved by decimation
+        ph0, ph1 = refine(full_spectrum, full_x_axis, (ph0, ph1), steps)
+    return float(ph0 % 2), float(ph1)
+
+def zero_order_phase_reference(complex_spectrum, start, first_step, precision):
+    """
+    Former Spectrum_1D.opt_zero_order_phase_corr, coordinate search of ph0 with
+    objective computed point by point. Slow, kept for comparison with auto_phase.
+    """
+    def spectrum_sum():
+        nonlocal complex_spectrum
+
+        spectrum = np.real(complex_spectrum)
+        score = 0
+
+        for i in spectrum:
+            if i > 0:
+                score += i
+            else:
+                score += -i*i
+        return score
+
+    angle = start
+    maximum = spectrum_sum()
+    step = first_step
+    improved = False
+    while True:
+        complex_spectrum = complex_spectrum*np.exp(step*1j*np.pi)
+        current = spectrum_sum()
+        angle += step
+        if current > maximum:
+            maximum = current
+            improved = True
+            value, counts = np.unique(np.round(np.real(complex_spectrum)/1000, 0), return_counts=True)
+        else:
+            angle -= step
+            complex_spectrum = complex_spectrum*np.exp(-step*1j*np.pi)
+            step /= 10
+        if abs(step) < precision:
+            if not improved:
+                step = -first_step
+                improved = True
+                continue
+            break
+
+    return angle
+
+
+if __name__ == "__main__":
+    # comparison of auto_phase with zero_order_phase_reference on every fid in example_fids
+    import os
+    from readingfids import open_experiment
+    from pipeline import ProcessingPipeline
+
+    examples = os.path.join(os.path.dirname(os.path.abspath(__file__)), "example_fids")
+    for folder, _, filenames in sorted(os.walk(examples)):
+        if "fid" not in filenames:
+            continue
+        info, fid = open_experiment(os.path.join(folder, "fid"))
+        pipeline = ProcessingPipeline()
+        spectrum = pipeline.run(fid[0], info)
+        unphased = pipeline.output("digital_filter")
+
+        start = time.perf_counter()
+        reference = zero_order_phase_reference(spectrum, 0, 1, 0.001)
+        reference_time = time.perf_counter() - start
+        print(os.path.relpath(folder, examples), len(spectrum), "points")
+        print(f"    reference      ph0 {reference % 2:7.3f}                {reference_time:8.3f} s")
+        x_axis = processing.phase_ramp(len(unphased), 0.5)
+
+        def check(ph0, ph1, ph0_grid, ph1_grid):
+            # result of search has to be global minimum of objective found by dense scan, minimum
+            # of spectra with few lines is flat, so objectives are compared, not positions
+            scores = evaluate(function, unphased, x_axis, ph0_grid, ph1_grid)
+            score, = evaluate(function, unphased, x_axis, ph0, ph1)
+            return score - scores.min() < 0.01*(np.median(scores) - scores.min())
+
+        for objective, function in OBJECTIVES.items():
+            for first_order in (False, True):
+                for decimation in (1, 8):
+                    start = time.perf_counter()
+                    ph0, ph1 = auto_phase(unphased, objective=objective, first_order=first_order,
+                                          decimation=decimation)
+                    elapsed = time.perf_counter() - start
+                    if first_order:
+                        # scan of ph1 with closed form ph0, refinement of ph0 can only improve it
+                        ph1_grid = np.linspace(-0.5, 0.5, 401)
+                        ph0_grid = optimal_ph0(unphased, x_axis, ph1_grid)
+                    else:
+                        ph0_grid, ph1_grid = np.linspace(0, 2, 2000, endpoint=False), 0.0
+                    found = check(ph0, ph1, ph0_grid, ph1_grid)
+                    print(f"    {objective:8} ph1={first_order!s:5} /{decimation} ph0 {ph0:7.3f} ph1 {ph1:7.3f}"
+                          f"  {elapsed:8.3f} s  {'minimum' if found else 'other minimum'}")
+                    # decimation of spectrum with narrow lines may change minimum of ph1
+                    assert found or (first_order and decimation > 1)
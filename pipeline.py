@@ -0,0 +1,259 @@
+"""
+Declarative processing of fid into spectrum, used by Spectrum_1D:
+    truncate -> linear_prediction -> zero_fill -> apodize -> fourier_transform -> digital_filter -> phase -> baseline
+
+Every stage is a dataclass containing only its parameters, output of every
+stage is cached by ProcessingPipeline, so after change of parameters of one
+stage only this stage and stages after it are recomputed. Pipeline is
+serializable with to_dict/from_dict, so the same processing may be applied to other fids.
+Stages work along the last axis, so 2D array of fids (one fid per row, e.g. arrayed
+experiment) is processed at once.
+"""
+import dataclasses
+from typing import ClassVar
+
+import processing
+import baseline
+import linear_prediction
+
+
+@dataclasses.dataclass
+class Truncate:
+    name : ClassVar[str] = "truncate"
+    size : int = None # number of fid points which are kept, None - all
+
+    def apply(self, data, info):
+        if self.size is None:
+            return data
+        return data[..., :self.size]
+
+
+@dataclasses.dataclass
+class LinearPrediction:
+    name : ClassVar[str] = "linear_prediction"
+    first_points : int = 0 # number of first points of fid replaced by backward prediction
+    extend : int = 0 # number of points predicted after end of fid
+    order : int = 32 # number of coefficients, should be greater than number of lines
+    points : int = None # number of points used for fitting, None - 16*order
+
+    def apply(self, data, info):
+        if self.first_points:
+            data = linear_prediction.rebuild_start(data, self.first_points, self.order, self.points)
+        if self.extend:
+            data = linear_prediction.extend_forward(data, self.extend, self.order, self.points)
+        return data
+
+
+@dataclasses.dataclass
+class ZeroFill:
+    name : ClassVar[str] = "zero_fill"
+    size : int = None # number of points after zero filling, if None mode is used
+    mode : str = "power_of_two" # "power_of_two", "fast" (2, 3, 5 factors only) or "none"
+
+    def apply(self, data, info):
+        if self.size is not None:
+            return processing.zero_fill_to_number(data, self.size)
+        if self.mode == "power_of_two":
+            return processing.zero_fill_to_power_of_two(data)
+        if self.mode == "fast":
+            return processing.zero_fill_to_fast_size(data)
+        if self.mode == "none":
+            return data
+        raise NotImplementedError(f"not implemented zero filling mode {self.mode}")
+
+
+@dataclasses.dataclass
+class Apodize:
+    name : ClassVar[str] = "apodize"
+    function : str = None # name of window function from processing.WINDOWS, None - no apodization
+    params : tuple = ()
+
+    def __post_init__(self):
+        self.params = tuple(self.params)
+
+    def apply(self, data, info):
+        if self.function is None:
+            return data
+        # input is cached output of previous stage, it can not be modified in place
+        data = data.copy()
+        processing.apodize.apply(self.function, data, info.dwell_time, *self.params)
+        return data
+
+
+@dataclasses.dataclass
+class FourierTransform:
+    name : ClassVar[str] = "fourier_transform"
+
+    def apply(self, data, info):
+        return processing.fourier_transform(data)
+
+
+@dataclasses.dataclass
+class DigitalFilter:
+    name : ClassVar[str] = "digital_filter"
+    # correct fractional part of group delay from info, readers shift fid by its integer part,
+    # so that time domain stages (truncate, linear_prediction, apodize) start at real t=0
+    group_delay : bool = True
+
+    def apply(self, data, info):
+        if self.group_delay:
+            data = processing.group_delay_correction(data, info.group_delay % 1)
+        # edges of jeol spectra are distorted by filter, correction needs untrimmed spectrum
+        return processing.trim_edges(data, info.trimmed if info.vendor == "jeol" else 0)
+
+
+@dataclasses.dataclass
+class PhaseCorrection:
+    name : ClassVar[str] = "phase"
+    ph0 : float = 0.0 # [pi]
+    ph1 : float = 0.0 # [pi]
+    pivot : float = 0.5 # [fraction of spectrum]
+
+    def apply(self, data, info):
+        return processing.phase_correction(data, self.ph0, self.ph1, self.pivot)
+
+
+@dataclasses.dataclass
+class BaselineCorrection:
+    name : ClassVar[str] = "baseline"
+    method : str = None # name of method from baseline.METHODS, None - no baseline correction
+    params : tuple = ()
+
+    def __post_init__(self):
+        self.params = tuple(self.params)
+
+    def apply(self, data, info):
+        if self.method is None:
+            return data
+        # baseline is computed from real part and subtracted from it, imaginary part is kept
+        corrected = data.copy()
+        for row in corrected.reshape(-1, corrected.shape[-1]):
+            row.real -= baseline.compute_baseline(row.real, self.method, *self.params)
+        return corrected
+
+
+STAGE_TYPES = (Truncate, LinearPrediction, ZeroFill, Apodize, FourierTransform, DigitalFilter,
+               PhaseCorrection, BaselineCorrection)
+
+
+class ProcessingPipeline:
+    """
+    Ordered stages of processing with cached outputs.
+
+    pipeline = ProcessingPipeline()
+    spectrum = pipeline.run(fid, info)
+    pipeline.update("phase", ph0=0.5)
+    spectrum = pipeline.run(fid, info) # only phase and baseline stages are computed again
+    """
+    def __init__(self, stages=None):
+        if stages is None:
+            stages = [stage_type() for stage_type in STAGE_TYPES]
+        if [type(i) for i in stages] != list(STAGE_TYPES):
+            raise ValueError("stages have to be in order: " +
+                             " -> ".join(i.name for i in STAGE_TYPES))
+        self.stages = list(stages)
+        self.invalidate()
+
+    def index(self, name):
+        for i, stage in enumerate(self.stages):
+            if stage.name == name:
+                return i
+        raise KeyError(name)
+
+    def stage(self, name):
+        return self.stages[self.index(name)]
+
+    def update(self, name, **params):
+        """
+        Changes parameters of stage, if they are different cached outputs
+        of this stage and all next ones are invalidated
+        """
+        i = self.index(name)
+        stage = dataclasses.replace(self.stages[i], **params)
+        if stage != self.stages[i]:
+            self.stages[i] = stage
+            self._valid = min(self._valid, i)
+
+    def invalidate(self, name=None):
+        # invalidates cached outputs of stage name and all next ones, all if name is None
+        if name is None:
+            self._outputs = [None] * len(self.stages)
+            self._input = None
+            self._info = None
+            self._valid = 0
+        else:
+            self._valid = min(self._valid, self.index(name))
+
+    def run(self, fid, info):
+        """
+        Returns complex spectrum made from fid, only stages whose outputs
+        are not cached are computed. Returned array is cached, it should not be modified in place.
+        """
+        if fid is not self._input or info is not self._info:
+            self.invalidate()
+            self._input = fid
+            self._info = info
+        data = fid if self._valid == 0 else self._outputs[self._valid - 1]
+        for i in range(self._valid, len(self.stages)):
+            data = self.stages[i].apply(data, info)
+            self._outputs[i] = data
+        self._valid = len(self.stages)
+        return data
+
+    def output(self, name):
+        # cached output of stage, None if it is not computed
+        i = self.index(name)
+        return self._outputs[i] if i < self._valid else None
+
+    def to_dict(self):
+        return {"stages" : [{"stage" : stage.name, **dataclasses.asdict(stage)}
+                            for stage in self.stages]}
+
+    @classmethod
+    def from_dict(cls, recipe):
+        stage_types = {stage_type.name : stage_type for stage_type in STAGE_TYPES}
+        given = {}
+        for params in recipe["stages"]:
+            params = dict(params)
+            name = params.pop("stage")
+            given[name] = stage_types[name](**params)
+        # stages missing in older recipes have default parameters
+        return cls([given.get(stage_type.name) or stage_type() for stage_type in STAGE_TYPES])
+
+    def copy(self):
+        # copy of parameters without cached outputs
+        return ProcessingPipeline([dataclasses.replace(stage) for stage in self.stages])
+
+    def __getstate__(self):
+        # cached outputs are not pickled
+        return {"stages" : self.stages}
+
+    def __setstate__(self, state):
+        self.stages = state["stages"]
+        self.invalidate()
+
+
+if __name__ == "__main__":
+    # group delay correction compared with former processing of bruker examples: readers rolled fid
+    # by integer part of delay, fractional part was first order phase -(delay % 1) with pivot 0.75,
+    # which differs from exact correction by constant zero order phase and, because left half
+    # of phase_ramp is offset by one point, by at most pi*(delay % 1)/half in left half
+    import os
+    import numpy as np
+    from readingfids import open_experiment
+
+    examples = os.path.join(os.path.dirname(os.path.abspath(__file__)), "example_fids", "bruker")
+    for name in sorted(os.listdir(examples)):
+        info, fid = open_experiment(os.path.join(examples, name, "fid"))
+        pipeline = ProcessingPipeline()
+        pipeline.run(fid[0], info)
+        corrected = pipeline.output("digital_filter")
+        former = processing.phase_correction(processing.fourier_transform(
+            processing.zero_fill_to_power_of_two(fid[0])), 0, -(info.group_delay % 1), 0.75)
+        constant = np.vdot(corrected, former)
+        difference = np.linalg.norm(corrected*constant/abs(constant) - former) / np.linalg.norm(former)
+        # time domain stages start at t=0: first points are the strongest, not filter pre-signal
+        start = np.abs(fid[0][:8]).max() / np.abs(fid[0]).max()
+        print(f"bruker/{name}: group delay {info.group_delay}, relative difference {difference:.2e}, "
+              f"first points {start:.2f} of maximum")
+        assert difference < np.pi*(info.group_delay % 1)/(len(former)//2) and start > 0.5
@@ -1,27 +1,395 @@
+import functools
+import collections
+import os
+import time
+
 import numpy as np
 
+# optional fft libraries, able to use many threads
+try:
+    import scipy.fft as scipy_fft
+except ImportError:
+    scipy_fft = None
+try:
+    import pyfftw.interfaces.numpy_fft as pyfftw_fft
+except ImportError:
+    pyfftw_fft = None
+
 POWERS_OF_TWO = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 
 2048, 4096, 8192, 16384, 32768, 65536, 131072, 262144, 524288, 
 1048576, 2097152, 4194304, 8388608, 16777216, 33554432, 67108864, 
 134217728, 268435456, 536870912, 1073741824, 2147483648, 4294967296, 8589934592)
 
 def zero_fill_to_power_of_two(fid):
-    if len(fid) in POWERS_OF_TWO:
+    # fid may be 1D array or 2D array with one fid per row
+    if fid.shape[-1] in POWERS_OF_TWO:
         return fid
     for i in POWERS_OF_TWO:
-        if i > len(fid):
-            fid = np.concatenate((fid, np.zeros(i-len(fid), dtype=fid.dtype)))
-            return fid
+        if i > fid.shape[-1]:
+            return zero_fill_to_number(fid, i)
+
+def next_fast_size(number):
+    """
+    Returns the smallest even number not smaller than number, whose only 
+    prime factors are 2, 3 and 5. FFT of such length is nearly as fast as for power of two,
+    e.g. 70000 -> 72000 instead of 131072
+    """
+    best = 2
+    while best < number:
+        best *= 2
+    power_of_five = 1
+    while power_of_five < best:
+        power_of_three = power_of_five
+        while power_of_three < best:
+            size = power_of_three * 2
+            while size < number:
+                size *= 2
+            best = min(best, size)
+            power_of_three *= 3
+        power_of_five *= 5
+    return best
+
+def zero_fill_to_fast_size(fid):
+    return zero_fill_to_number(fid, next_fast_size(fid.shape[-1]))
 
 def zero_fill_to_number(fid, number):
-    if number < len(fid):
+    if number <= fid.shape[-1]:
         return fid
-    fid = np.concatenate((fid, np.zeros(number-len(fid), dtype=fid.dtype)))
-    return fid
+    result = np.zeros(fid.shape[:-1] + (number,), dtype=fid.dtype)
+    result[..., :fid.shape[-1]] = fid
+    return result
+
+def fourier_transform(fid, trimmed=0):
+    """
+    Fourier transform of fid into complex spectrum in order in which it is displayed,
+    fids stacked in 2D array (one fid per row) are transformed by one call of fft
+    
+    Parameters
+    ----------
+    fid : np.array
+        complex fid, or 2D array of fids.
+    trimmed : float
+        [% of points] cut from both edges of spectrum, used for jeol spectra
+
+    Returns
+    -------
+    np.array
+        complex spectrum, or 2D array of spectra
+
+    """
+    spectrum = fft(fid)
+    half = spectrum.shape[-1] // 2
+    # both halves are reversed in place, numpy buffers overlapping views
+    spectrum[..., :half] = spectrum[..., :half][..., ::-1]
+    spectrum[..., half:] = spectrum[..., half:][..., ::-1]
+    return trim_edges(spectrum, trimmed)
+
+def trim_edges(spectrum, trimmed):
+    # view of spectrum without trimmed [% of points] from both edges, used for jeol spectra
+    if not trimmed:
+        return spectrum
+    cut = int(trimmed/100*spectrum.shape[-1])
+    return spectrum[..., cut:spectrum.shape[-1]-cut]
+
+def group_delay_correction(spectrum, delay):
+    """
+    Returns copy of complex spectrum (output of fourier_transform without trimming)
+    corrected for group delay of digital filter
+
+    Parameters
+    ----------
+    spectrum : np.array
+        complex spectrum, or 2D array of spectra.
+    delay : float
+        [points of fid] group delay, may be fractional.
+
+    Returns
+    -------
+    np.array
+        spectrum of fid shifted back by delay points
+
+    """
+    if not delay:
+        return spectrum
+    return spectrum*group_delay_ramp(spectrum.shape[-1], float(delay))
+
+@functools.lru_cache(maxsize=16)
+def group_delay_ramp(length, delay):
+    """
+    Returns factors which shift fid back by delay points, shift is linear phase
+    in frequency domain. In order of fourier_transform point j has frequency
+    length//2 - 1 - j [cycles per fid]. 
+    Returned array is read only, because it is shared by all users of cache
+    """
+    frequency = length//2 - 1 - np.arange(length)
+    factors = np.exp(2j*np.pi*delay/length*frequency)
+    factors.flags.writeable = False
+    return factors
+
+def phase_correction(spectrum, ph0, ph1, pivot):
+    """
+    Returns phase corrected copy of complex spectrum
+
+    Parameters
+    ----------
+    spectrum : np.array
+        complex spectrum.
+    ph0 : float
+        [pi] zero order phase correction.
+    ph1 : float
+        [pi] first order phase correction, equal to difference of phase at edges of spectrum
+    pivot : float
+        [fraction of spectrum] point in which first order correction is zero.
+
+    Returns
+    -------
+    np.array
+        corrected spectrum
+
+    """
+    if not ph1:
+        return spectrum*np.exp(ph0*1j*np.pi)
+    x_axis = phase_ramp(spectrum.shape[-1], pivot)
+    return spectrum*np.exp(1j*np.pi*(ph0 + ph1*x_axis))
+
+@functools.lru_cache(maxsize=16)
+def phase_ramp(length, pivot):
+    """
+    Returns x axis of first order phase correction, it goes from -1 to 1 (first point
+    of the right half is 0) and is shifted so that it is zero at pivot.
+    Returned array is read only, because it is shared by all users of cache
+    """
+    pivot = -(pivot - 0.5)*2
+    half = max(length // 2, 1)
+    x_axis = np.concatenate((-np.arange(half)[::-1], np.arange(length - half))) / half
+    x_axis += pivot
+    x_axis.flags.writeable = False
+    return x_axis
+
+# [arbitrary units] distance of points used for integration of spectra
+INTEGRATION_STEP = 0.001
+
+def cumulative_integral(spectrum, dx=INTEGRATION_STEP):
+    """
+    Returns cumulative trapezoid integral along last axis, element k is integral from 
+    point 0 to point k, so integral of points begin:end is result[end-1] - result[begin]
+    """
+    areas = (spectrum[..., :-1] + spectrum[..., 1:]) * (dx/2)
+    result = np.zeros(spectrum.shape, dtype=np.result_type(areas, np.double))
+    np.cumsum(areas, axis=-1, out=result[..., 1:])
+    return result
+
+def region_integrals(cumulative, begin_points, end_points):
+    """
+    Returns trapezoid integrals of regions begin_points:end_points (arrays of data point numbers)
+    from cumulative integral, for 2D cumulative one row of integrals per spectrum.
+    Regions shorter than two points are equal to zero, the same as np.trapz.
+    """
+    length = cumulative.shape[-1]
+    begin_points = np.clip(np.asarray(begin_points), 0, length)
+    end_points = np.clip(np.asarray(end_points), 0, length)
+    valid = end_points - begin_points >= 2
+    begin_values = np.take(cumulative, np.minimum(begin_points, length - 1), axis=-1)
+    end_values = np.take(cumulative, np.maximum(end_points - 1, 0), axis=-1)
+    return np.where(valid, end_values - begin_values, 0.0)
+
+def numpy_fft(data, workers):
+    return np.fft.fft(data, axis=-1)
+
+def scipy_fft_function(data, workers):
+    return scipy_fft.fft(data, axis=-1, workers=workers)
+
+def pyfftw_fft_function(data, workers):
+    return pyfftw_fft.fft(data, axis=-1, threads=workers)
+
+# transforms of real data and their inverses, size - number of points of real data (zero padded)
+def numpy_rfft(data, size, workers):
+    return np.fft.rfft(data, size, axis=-1)
+
+def numpy_irfft(data, size, workers):
+    return np.fft.irfft(data, size, axis=-1)
+
+def scipy_rfft(data, size, workers):
+    return scipy_fft.rfft(data, size, axis=-1, workers=workers)
+
+def scipy_irfft(data, size, workers):
+    return scipy_fft.irfft(data, size, axis=-1, workers=workers)
+
+def pyfftw_rfft(data, size, workers):
+    return pyfftw_fft.rfft(data, size, axis=-1, threads=workers)
+
+def pyfftw_irfft(data, size, workers):
+    return pyfftw_fft.irfft(data, size, axis=-1, threads=workers)
+
+FFT_BACKENDS = {"numpy" : numpy_fft}
+RFFT_BACKENDS = {"numpy" : (numpy_rfft, numpy_irfft)}
+if pyfftw_fft is not None:
+    FFT_BACKENDS["pyfftw"] = pyfftw_fft_function
+    RFFT_BACKENDS["pyfftw"] = (pyfftw_rfft, pyfftw_irfft)
+if scipy_fft is not None:
+    FFT_BACKENDS["scipy"] = scipy_fft_function
+    RFFT_BACKENDS["scipy"] = (scipy_rfft, scipy_irfft)
+
+# currently used backend, changed by set_fft_backend
+fft_backend = {"name" : "numpy", "workers" : 1}
+
+def set_fft_backend(name=None, workers=None):
+    """
+    Chooses library used for all fourier transforms
+
+    Parameters
+    ----------
+    name : str, optional
+        key of FFT_BACKENDS: "numpy", "scipy" or "pyfftw". The default is the first 
+        installed one of scipy, pyfftw, numpy.
+    workers : int, optional
+        number of threads used by backend, default is number of processors, ignored by numpy
+
+    """
+    if name is None:
+        name = next(i for i in ("scipy", "pyfftw", "numpy") if i in FFT_BACKENDS)
+    if name not in FFT_BACKENDS:
+        raise NotImplementedError(f"fft backend {name} is not available")
+    fft_backend["name"] = name
+    fft_backend["workers"] = workers if workers else os.cpu_count()
+
+def fft(data):
+    # fourier transform along last axis using current backend
+    return FFT_BACKENDS[fft_backend["name"]](data, fft_backend["workers"])
+
+def rfft(data, size):
+    # fourier transform of real data zero padded to size points along last axis using current backend
+    return RFFT_BACKENDS[fft_backend["name"]][0](data, size, fft_backend["workers"])
+
+def irfft(data, size):
+    # inverse of rfft, real result of size points
+    return RFFT_BACKENDS[fft_backend["name"]][1](data, size, fft_backend["workers"])
+
+set_fft_backend()
+
+FftSizeOption = collections.namedtuple("FftSizeOption", 
+    "mode, size, resolution, backend, fft_time")
+# mode - zero filling mode
+# size - number of points after zero filling
+# resolution - [Hz] distance between points of spectrum
+# backend - name of fft backend
+# fft_time - [s] time of single fourier transform
+
+def fft_size_report(length, dwell_time, repeats=3):
+    """
+    Compares zero filling modes for fid of given length on all available fft backends
+
+    Parameters
+    ----------
+    length : int
+        number of points of fid.
+    dwell_time : float
+        [s] time between points of fid.
+    repeats : int
+        best time of repeats transforms is reported
+
+    Returns
+    -------
+    list of FftSizeOption
+
+    """
+    sizes = {"none" : length, 
+             "fast" : next_fast_size(length), 
+             "power_of_two" : len(zero_fill_to_power_of_two(np.zeros(length)))}
+    report = []
+    for mode, size in sizes.items():
+        data = np.zeros(size, dtype=np.csingle)
+        data[:length] = np.exp(-np.arange(length)/length*5j)
+        for backend, function in FFT_BACKENDS.items():
+            fft_time = float("inf")
+            for i in range(repeats):
+                start = time.perf_counter()
+                function(data, fft_backend["workers"])
+                fft_time = min(fft_time, time.perf_counter() - start)
+            report.append(FftSizeOption(mode, size, 1/(size*dwell_time), backend, fft_time))
+    return report
 
 class apodize:
+    """
+    Window functions for apodization of fid, each of them multiplies fid in place.
+    Windows are cached per (function, length, dwell_time, params), so the same 
+    window is computed once for whole batch of fids. 
+    Functions may be also chosen by name: apodize.apply("gaussian", fid, dwell_time, 1.0, 2.0)
+    """
+    
+    @staticmethod
+    def apply(function_type, fid, dwell_time, *params):
+        if function_type not in WINDOWS:
+            raise NotImplementedError(f"not implemented window function {function_type}")
+        fid *= window(function_type, fid.shape[-1], dwell_time, *params)
+    
     @staticmethod
     def exponential(fid, dwell_time, constant):
-        multipliers = np.array([np.exp(-i*dwell_time*constant*np.pi) for i in range(len(fid))])
-        for i in range(len(fid)):
-            fid[i] = fid[i] * multipliers[i]
\ No newline at end of file
+        # constant - [Hz] line broadening
+        apodize.apply("exponential", fid, dwell_time, constant)
+        
+    @staticmethod
+    def gaussian(fid, dwell_time, lorentz_width, gauss_width):
+        # Lorentz to Gauss transformation
+        # lorentz_width - [Hz] width of lorentzian lines to be removed
+        # gauss_width - [Hz] width of resulting gaussian lines
+        apodize.apply("gaussian", fid, dwell_time, lorentz_width, gauss_width)
+    
+    @staticmethod
+    def sine_bell(fid, dwell_time, offset=0.0):
+        # offset - [pi] shift of sine bell, 0.0 - sine, 0.5 - cosine
+        apodize.apply("sine_bell", fid, dwell_time, offset)
+        
+    @staticmethod
+    def sine_bell_squared(fid, dwell_time, offset=0.0):
+        # offset - [pi] shift of sine bell, 0.0 - sine, 0.5 - cosine
+        apodize.apply("sine_bell_squared", fid, dwell_time, offset)
+    
+    @staticmethod
+    def trapezoid(fid, dwell_time, rise, fall):
+        # rise, fall - [fraction of fid] length of linear increase at the beginning 
+        # and decrease at the end of window
+        apodize.apply("trapezoid", fid, dwell_time, rise, fall)
+
+@functools.lru_cache(maxsize=16)
+def window(function_type, length, dwell_time, *params):
+    # returned array is read only, because it is shared by all users of cache
+    result = WINDOWS[function_type](length, dwell_time, *params)
+    result.flags.writeable = False
+    return result
+
+def exponential_window(length, dwell_time, constant):
+    time = np.arange(length) * dwell_time
+    return np.exp(-time*constant*np.pi)
+
+def gaussian_window(length, dwell_time, lorentz_width, gauss_width):
+    time = np.arange(length) * dwell_time
+    return np.exp(time*lorentz_width*np.pi - (time*gauss_width*np.pi)**2 / (4*np.log(2)))
+
+def sine_bell_window(length, dwell_time, offset=0.0):
+    position = np.linspace(0, 1, length)
+    return np.sin(np.pi*offset + np.pi*(1 - offset)*position)
+
+def sine_bell_squared_window(length, dwell_time, offset=0.0):
+    return sine_bell_window(length, dwell_time, offset)**2
+
+def trapezoid_window(length, dwell_time, rise, fall):
+    points = np.arange(length, dtype=np.double)
+    result = np.ones(length)
+    if rise > 0:
+        np.minimum(result, points / (rise*length), out=result)
+    if fall > 0:
+        np.minimum(result, (length - 1 - points) / (fall*length), out=result)
+    return result
+
+WINDOWS = {
+    "exponential" : exponential_window,
+    "gaussian" : gaussian_window,
+    "sine_bell" : sine_bell_window,
+    "sine_bell_squared" : sine_bell_squared_window,
+    "trapezoid" : trapezoid_window,
+    }
+
+if __name__ == "__main__":
+    for option in fft_size_report(70000, 1/8000):
+        print(option)
@@ -1,8 +1,8 @@
 import os
 
-from file_io.agilent import agilent_wrapper
-from file_io.bruker import bruker_wrapper
-from file_io.jeol_jdf import jdf_wrapper
+from file_io.agilent import agilent_wrapper, agilent_info_wrapper
+from file_io.bruker import bruker_wrapper, bruker_ser_wrapper, bruker_info_wrapper, title_path_bruker
+from file_io.jeol_jdf import jdf_wrapper, jdf_info_wrapper
 
 def fid_file_type(path):
     pass
@@ -18,6 +18,9 @@ def fid_file_type(path):
             return "agilent"
         if os.path.isfile(os.path.join(os.path.dirname(path), "acqus")):
             return "bruker"
+    if filename[-3:] == "ser" or os.path.isfile(os.path.join(os.path.dirname(path), "ser")):
+        if os.path.isfile(os.path.join(os.path.dirname(path), "acqu2s")):
+            return "bruker_ser"
     
     
     # if not os.path.isfile(os.path.join(path, "fid")):
@@ -27,16 +30,50 @@ def fid_file_type(path):
     # if os.path.isfile(os.path.join(path, "acqus")):
     #     return "bruker"
 
-def open_experiment(path):
+def open_experiment(path, use_mmap=False):
+    # use_mmap - binary data is decoded directly from memory map of file 
+    # instead of being read into memory as a whole first
     path = os.path.abspath(path)
     ftype = fid_file_type(path)
     if ftype == "agilent":
-        info, fid = agilent_wrapper(os.path.dirname(path))
+        info, fid = agilent_wrapper(os.path.dirname(path), use_mmap)
     elif ftype == "bruker":
-        info, fid = bruker_wrapper(os.path.dirname(path))
+        info, fid = bruker_wrapper(os.path.dirname(path), use_mmap)
+    elif ftype == "bruker_ser":
+        info, fid = bruker_ser_wrapper(os.path.dirname(path))
     elif ftype == "jdf":
-        info, fid = jdf_wrapper(path)
+        info, fid = jdf_wrapper(path, use_mmap)
     else:
         raise NotImplementedError("not implemented type")
     
-    return info, fid
\ No newline at end of file
+    return info, fid
+
+def open_experiment_info(path):
+    # reads only parameters of experiment (procpar, acqus or jdf header and params),
+    # fid data is never read, intended for cataloguing many experiments
+    path = os.path.abspath(path)
+    ftype = fid_file_type(path)
+    if ftype == "agilent":
+        info = agilent_info_wrapper(os.path.dirname(path))
+    elif ftype in ("bruker", "bruker_ser"):
+        info = bruker_info_wrapper(os.path.dirname(path))
+    elif ftype == "jdf":
+        info = jdf_info_wrapper(path)
+    else:
+        raise NotImplementedError("not implemented type")
+    
+    return info
+
+def parameter_files(path):
+    # files other than fid (ser) parsed when experiment is opened, e.g. for keys of FidCache,
+    # jdf file contains its params
+    path = os.path.abspath(path)
+    folder = os.path.dirname(path)
+    ftype = fid_file_type(path)
+    if ftype == "agilent":
+        return [os.path.join(folder, "procpar")]
+    if ftype == "bruker":
+        return [os.path.join(folder, "acqus"), title_path_bruker(folder)]
+    if ftype == "bruker_ser":
+        return [os.path.join(folder, "acqus"), os.path.join(folder, "acqu2s"), title_path_bruker(folder)]
+    return []
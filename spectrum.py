@@ -12,12 +12,33 @@ import numpy as np
 
 from readingfids import open_experiment
 import processing
+import phasing
+import baseline
+import peak_picking
+import noise
+import deconvolution
+from pipeline import ProcessingPipeline
 
 @dataclasses.dataclass
 class Phase:
     ph0: float
     ph1: float
     pivot: float
+    
+    def combined(self, new_phase):
+        """
+        Returns Phase in which fields of new_phase that are not None replace fields of self,
+        pivot is changed only together with ph1, new_phase None means no correction
+        """
+        if new_phase is None:
+            return Phase(0.0, 0.0, 0.5)
+        if type(new_phase) in (list, tuple):
+            new_phase = Phase(*new_phase)
+        ph0 = self.ph0 if new_phase.ph0 is None else new_phase.ph0
+        if new_phase.ph1 is None:
+            return Phase(ph0, self.ph1, self.pivot)
+        pivot = self.pivot if new_phase.pivot is None else new_phase.pivot
+        return Phase(ph0, new_phase.ph1, pivot)
 
 
 class Spectrum_1D:
@@ -35,10 +56,21 @@ class Spectrum_1D:
         
         # _integral_rel_one : float - real value of integral that is set to be equal one as relative value
         
-        # _signal_treshold : minimal y-value for signal to be considered non zero in integration etc
+        # _cumulative_integral : tuple or None - (spectrum, its cumulative integral) used by integrate
+        
+        # _signal_treshold : minimal y-value for signal to be considered non zero in integration etc,
+        #   noise level of spectrum unless calc_treshold was called with range
+        
+        # _noise_level : tuple or None - (spectrum, its noise level) used by noise_level
         
         # _complex_spectrum : np.array of complex values, full spectrum of both domains
         
+        # _cache : file_io.cache.FidCache or None - cache from which fid is restored
+        
+        # _preview_cache : tuple or None - decimated unphased spectrum used by preview_phase
+        
+        # _fid is never modified, all processing is described by self.pipeline
+        
         #--------------------------------------
         # public variables
         
@@ -55,10 +87,19 @@ class Spectrum_1D:
         #   apply second one will reset first. If true they may be several ones applied - but it will be hard to make gui for that
         
         # phase : object of Phase class, describing applied phase correction
+        
+        # pipeline : pipeline.ProcessingPipeline - processing of fid into spectrum 
+        #   truncate -> linear prediction -> zero fill -> apodize -> fourier transform 
+        #   -> digital filter -> phase -> baseline
+        #   with cached output of every stage
        
         # peak_list : TO BE EXPLAINED! including format of members
         
-        # auto_peak_list : list of peaks found by algorithmic means, format to be specified
+        # auto_peak_list : np.array of peak_picking.PEAK_TYPE - peaks found by find_peaks,
+        #   fields index, position [fraction], ppm, hz, height, width [Hz]
+        
+        # fitted_lines : np.array of deconvolution.LINE_TYPE - lines fitted by deconvolve,
+        #   fields region, point, ppm, hz, height, width, width_hz, width_ppm, eta, area, rms
         
         # auto_phase : object of Phase class, containing phase correction which was auto applied
         
@@ -71,6 +112,11 @@ class Spectrum_1D:
         self._fid = fid
         self.path = path
         self.info = info 
+        self._cache = None
+        self._preview_cache = None
+        
+        self.pipeline = ProcessingPipeline()
+        self.phase = Phase(0.0, 0.0, 0.5)
         
         self.zero_fill_to_next_power_of_two()
         #self.apodize("exponential", 1/self.info["acquisition_time"])
@@ -81,30 +127,23 @@ class Spectrum_1D:
         
         
         self._integral_rel_one = None
+        self._cumulative_integral = None
+        self._noise_level = None
         self.integral_list = []
 
         self.peak_list = []
+        self.fitted_lines = np.empty(0, dtype=deconvolution.LINE_TYPE)
         
         self.complex_first_order_corr = False
-
-        self.phase = Phase(0.0, 0.0, 0.5)
-        
-        # to be done somewhere else, why pivot should be in 0.75? test with more spectra
-        if self.info.group_delay:
-            self.set_phase(Phase(None, -(self.info.group_delay%1), 0.75))
         
-        self.set_phase(Phase(self.opt_zero_order_phase_corr(0, 1, 0.001), None, None))
+        # group delay is corrected by readers (integer part) and digital_filter stage of pipeline
+        self.optimize_phase()
         
         self.auto_phase = dataclasses.replace(self.phase)
 
-        # value to be decided - placeholder currently
-        self._signal_treshold = np.average(self.spectrum)/2
-        
-        self.auto_peak_list = []
-        
         self.calc_treshold()
         
-        # self.find_peaks()
+        self.find_peaks()
         
         # print(self.info["group_delay"])
         # print(max(self.spectrum))
@@ -114,9 +153,29 @@ class Spectrum_1D:
         # print(self.phase_correction)
 
     @classmethod
-    def create_from_file(cls, path):        
-        info, fid = open_experiment(path)
-        return cls(fid[0], info, path)
+    def create_from_file(cls, path, cache=None):
+        # cache - optional file_io.cache.FidCache, decoded fids are read from it if possible
+        if cache is None:
+            info, fid = open_experiment(path)
+        else:
+            info, fid = cache.open_experiment(path)
+        spectrum = cls(fid[0], info, path)
+        spectrum._cache = cache
+        return spectrum
+    
+    def __getstate__(self):
+        # used when spectra are pickled e.g. sent back from worker processes,
+        # only fid, complex spectrum, info and results are sent, derived arrays are skipped
+        state = self.__dict__.copy()
+        del state["spectrum"]
+        state["_preview_cache"] = None
+        state["_cumulative_integral"] = None
+        state["_noise_level"] = None
+        return state
+    
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.spectrum = np.real(self._complex_spectrum)
     
     def zero_fill_to_next_power_of_two(self):
         """
@@ -128,24 +187,96 @@ class Spectrum_1D:
         None.
 
         """
-        self._fid = processing.zero_fill_to_power_of_two(self._fid)
+        self.pipeline.update("zero_fill", size=None, mode="power_of_two")
+        self.generate_spectrum()
+    
+    def zero_fill_to_fast_size(self):
+        """
+        Fills fid with 0 + 0j up to the nearest even length with only 2, 3 and 5 
+        as prime factors, it is usually much shorter than next power of two
+        and fourier transform is nearly as fast.
+        """
+        self.pipeline.update("zero_fill", size=None, mode="fast")
+        self.generate_spectrum()
+    
+    def fft_size_report(self):
+        # resolution and time of fourier transform for zero filling modes and fft backends
+        return processing.fft_size_report(len(self._fid), self.info.dwell_time)
     
     def zero_to_number(self, number):
-        self._fid = processing.zero_fill_to_number(self._fid, number)
+        self.pipeline.update("zero_fill", size=number)
         self.generate_spectrum()
         
     def truncate_to_number(self, number):
-        self._fid = self._fid[:number]
+        self.pipeline.update("truncate", size=number)
+        self.pipeline.update("zero_fill", size=number)
         self.generate_spectrum()
         
     def restore_fid(self):
-        _, self._fid = open_experiment(self.path)
+        """
+        Reads fid again and removes truncation, linear prediction, zero filling and apodization,
+        phase correction is kept
+        """
+        if self._cache is None:
+            _, self._fid = open_experiment(self.path)
+        else:
+            _, self._fid = self._cache.open_experiment(self.path)
         self._fid = self._fid[0]
+        self.pipeline.update("truncate", size=None)
+        self.pipeline.update("linear_prediction", first_points=0, extend=0)
+        self.pipeline.update("zero_fill", size=None, mode="none")
+        self.pipeline.update("apodize", function=None, params=())
+        self.generate_spectrum()
+        
+    def linear_prediction(self, first_points=0, extend=0, order=32):
+        """
+        Replaces first_points first points of fid by backward linear prediction
+        and extends fid by extend points of forward linear prediction (e.g. truncated fid),
+        see linear_prediction module. Zero values remove prediction.
+        """
+        self.pipeline.update("linear_prediction", first_points=first_points, extend=extend, order=order)
         self.generate_spectrum()
         
     def apodize(self, function_type, *params):
-        if function_type == "exponential":
-            processing.apodize.exponential(self._fid, self.info.dwell_time, *params)
+        # function_type - name of window function from processing.WINDOWS, None removes apodization
+        # window replaces previously applied one
+        if function_type is not None and function_type not in processing.WINDOWS:
+            raise NotImplementedError(f"not implemented window function {function_type}")
+        self.pipeline.update("apodize", function=function_type, params=params)
+        self.generate_spectrum()
+        
+    def correct_baseline(self, method, *params):
+        # method - name of method from baseline.METHODS, None removes baseline correction
+        # params - parameters of method, e.g. order of polynomial
+        if method is not None and method not in baseline.METHODS:
+            raise NotImplementedError(f"not implemented baseline correction {method}")
+        self.pipeline.update("baseline", method=method, params=params)
+        self.generate_spectrum()
+    
+    @property
+    def baseline(self):
+        # baseline subtracted from spectrum, computed by pipeline and cached with its outputs
+        phased = self.pipeline.output("phase")
+        if phased is None or self.pipeline.stage("baseline").method is None:
+            return np.zeros(len(self.spectrum))
+        return np.real(phased) - self.spectrum
+    
+    def set_pipeline(self, recipe):
+        """
+        Replaces processing of spectrum by pipeline described by recipe, 
+        e.g. made by other_spectrum.pipeline.to_dict()
+
+        Parameters
+        ----------
+        recipe : dict or ProcessingPipeline
+
+        """
+        if isinstance(recipe, ProcessingPipeline):
+            self.pipeline = recipe.copy()
+        else:
+            self.pipeline = ProcessingPipeline.from_dict(recipe)
+        stage = self.pipeline.stage("phase")
+        self.phase = Phase(stage.ph0, stage.ph1, stage.pivot)
         self.generate_spectrum()
     
     def generate_power_mode_spectrum(self):
@@ -158,21 +289,8 @@ class Spectrum_1D:
         self.pow_spectrum = pow_spectr
     
     def generate_spectrum(self):
-        pass
-        # a = np.fft.fft(np.real(self._fid))
-        # b = np.fft.fft(np.imag(self._fid))
-        # spectrum = np.array([i + j for i, j in zip(a,b)])
-        # # # 
-        ft = np.fft.fft(self._fid)
-        left_half = ft[:len(ft)//2][::-1]
-        rigth_half = ft[len(ft)//2:][::-1]
-        spectrum = np.concatenate((left_half, rigth_half))
-        if self.info.vendor == "jeol":
-            spectrum = spectrum[int(self.info.trimmed/100*len(spectrum)):
-                                len(spectrum)-int(self.info.trimmed/100*len(spectrum))]
-        
-        self._complex_spectrum = spectrum
-        # # self._complex_spectrum = rigth_half
+        # only stages of pipeline whose parameters were changed are computed
+        self._complex_spectrum = self.pipeline.run(self._fid, self.info)
         self.spectrum = np.real(self._complex_spectrum)
         
     
@@ -247,36 +365,16 @@ class Spectrum_1D:
         # to be added: checking input validity
         
         # translation of values in ppm or fraction to data points number
-        
-        if vtype == "ppm":
-            if begin < end: 
-                begin, end = end , begin
-                
-            begin = begin - self.info.plot_begin_ppm
-            begin = begin/(self.info.plot_end_ppm - self.info.plot_begin_ppm)
-            begin = 1 - begin
-            
-            end = end - self.info.plot_begin_ppm
-            end = end/(self.info.plot_end_ppm - self.info.plot_begin_ppm)
-            end = 1 - end
-            
-        elif vtype == "fraction":
-            if begin > end:
-                begin, end = end, begin
-        else:
-            raise ValueError
-            
-        begin_point = round(begin*len(self.spectrum))
-        end_point = round(end*len(self.spectrum))
+        begin, end, begin_point, end_point = self._integration_bounds(begin, end, vtype)
+        begin, end = float(begin), float(end)
         
         # setting low values to zero, it allows broad integrals where there are no peaks
         # to be equal to zero
-        peak_values = self.spectrum[begin_point:end_point]
         # peak_values[peak_values < self._signal_treshold] = 0
         
         # numerical integration - trapezoid rule, 
         # to be considered simpsons rule or simple summation
-        real_value = np.trapz(peak_values, dx=0.001)
+        real_value = float(processing.region_integrals(self.cumulative_integral(), begin_point, end_point))
         
         if not self._integral_rel_one:
             relative_value = 1.0
@@ -289,12 +387,74 @@ class Spectrum_1D:
         self.integral_list.append([begin, end, real_value, relative_value])
         return [begin, end, real_value, relative_value]
     
+    def integrate_regions(self, begins, ends, vtype="fraction", append=False, snr=False):
+        """
+        Integrates many regions at once, the same way as integrate
+
+        Parameters
+        ----------
+        begins, ends : arrays of numeric values [ppm or fraction]
+            bounds of regions, order of begin and end of region is irrelevant
+        vtype : "ppm" or "fraction"
+        append : bool
+            if True integrals are appended to self.integral_list as by integrate
+        snr : bool
+            if True signal to noise ratios of integrals are returned too, noise of integral 
+            grows with square root of number of independent points in region
+
+        Returns
+        -------
+        (np.array, np.array) or (np.array, np.array, np.array)
+            real and relative values of integrals, if relative one is not set,
+            first region is equal to one, and their signal to noise ratios
+
+        """
+        begins, ends, begin_points, end_points = self._integration_bounds(
+            np.asarray(begins, dtype=np.double), np.asarray(ends, dtype=np.double), vtype)
+        real_values = processing.region_integrals(self.cumulative_integral(), begin_points, end_points)
+        
+        rel_one = self._integral_rel_one
+        if not rel_one and len(real_values):
+            rel_one = real_values[0]
+        relative_values = real_values / rel_one if rel_one else np.full(len(real_values), np.nan)
+        
+        if append:
+            if not self._integral_rel_one and len(real_values):
+                self._integral_rel_one = rel_one
+            self.integral_list.extend([list(i) for i in zip(
+                begins.tolist(), ends.tolist(), real_values.tolist(), relative_values.tolist())])
+        if snr:
+            points = np.maximum(end_points - begin_points, 1)
+            integral_noise = self.noise_level() * processing.INTEGRATION_STEP * np.sqrt(points * self.noise_correlation())
+            return real_values, relative_values, real_values / integral_noise
+        return real_values, relative_values
+    
+    def _integration_bounds(self, begin, end, vtype):
+        # converts bounds (numbers or arrays) in ppm or fraction to ordered fractions and data points
+        if vtype == "ppm":
+            begin = 1 - (begin - self.info.plot_begin_ppm)/(self.info.plot_end_ppm - self.info.plot_begin_ppm)
+            end = 1 - (end - self.info.plot_begin_ppm)/(self.info.plot_end_ppm - self.info.plot_begin_ppm)
+        elif vtype != "fraction":
+            raise ValueError
+        begin, end = np.minimum(begin, end), np.maximum(begin, end)
+        return (begin, end, np.round(begin*len(self.spectrum)).astype(np.int64), 
+                np.round(end*len(self.spectrum)).astype(np.int64))
+    
+    def cumulative_integral(self):
+        """
+        Cumulative integral of self.spectrum, see processing.cumulative_integral,
+        it is computed again only when self.spectrum is replaced (e.g. by generate_spectrum)
+        """
+        if self._cumulative_integral is None or self._cumulative_integral[0] is not self.spectrum:
+            self._cumulative_integral = (self.spectrum, processing.cumulative_integral(self.spectrum))
+        return self._cumulative_integral[1]
+    
     def quick_peak(self, rang):
         # docstring would be a nice addition
         # just for working with gui, this picks the max in a selected range
         rang = [round(i*len(self.spectrum)) for i in rang]
         spect_sliced = self.spectrum[rang[0]:rang[1]]
-        index = max(range(len(spect_sliced)), key=spect_sliced.__getitem__)
+        index = int(np.argmax(spect_sliced))
         index+=rang[0]
         x_value = index/len(self.spectrum)
         peak_ppm = self.info.plot_end_ppm - x_value*(self.info.plot_end_ppm - self.info.plot_begin_ppm)
@@ -368,98 +528,59 @@ class Spectrum_1D:
 
 
         """
-        # print("set_phase: ", new_phase)
-        if type(new_phase) in (list, tuple):
-            new_phase = Phase(*new_phase)
-            
-            
-        if new_phase == None:
-            self.phase = Phase(0.0, 0.0, 0.5)
-            self.generate_spectrum()
-            return
-        
-        if not new_phase.ph0 is None:
-            ph0 = new_phase.ph0 - self.phase.ph0
-            if ph0:
-                self._complex_spectrum = self._complex_spectrum*np.exp(ph0*1j*np.pi)
-                self.phase.ph0 = new_phase.ph0
-            
-        if not new_phase.ph1 is None:
-            if new_phase.pivot == self.phase.pivot:
-                ph1 = new_phase.ph1 - self.phase.ph1
-            else:
-                self.generate_spectrum()
-                self.set_phase(Phase(self.phase.ph0, None, None))
-                ph1 = new_phase.ph1
-                
-            if not ph1:
-                return
-            pivot = -(new_phase.pivot - 0.5)*2
-            length = len(self._complex_spectrum)
-            length = length // 2
-            half = [i/length for i in range(length)]
-            x_axis = [-i for i in half[::-1]] + half
-            length = length * 2
-            x_axis = [i + pivot for i in x_axis]
-            correction = [np.exp(1j*ph1*i*np.pi) for i in x_axis]
-            for i in range(len(self._complex_spectrum)):
-                self._complex_spectrum[i] = self._complex_spectrum[i]*correction[i]
-            self.phase.ph1 = new_phase.ph1
-            self.phase.pivot = new_phase.pivot
+        self.phase = self.phase.combined(new_phase)
         
-        self.spectrum = np.real(self._complex_spectrum)
+        # correction is applied to unphased spectrum cached by pipeline
+        self.pipeline.update("phase", ph0=self.phase.ph0, ph1=self.phase.ph1, pivot=self.phase.pivot)
+        self.generate_spectrum()
                 
-    def opt_zero_order_phase_corr(self, start, first_step, precision):
-        # temporary solution, later proper algorithm will be implemented
-        complex_spectrum = self._complex_spectrum.copy()
-        
-        def spectrum_sum():
-            nonlocal complex_spectrum
-            
-            spectrum = np.real(complex_spectrum)
-            score = 0
-            
-            for i in spectrum:
-                if i > 0:
-                    score += i
-                else:
-                    score += -i*i
-            return score
-            
-        angle = start
-        maximum = spectrum_sum()
-        step = first_step
-        improved = False
-        #print(angle, maximum)
-        while True:
-            complex_spectrum = complex_spectrum*np.exp(step*1j*np.pi)
-            current = spectrum_sum()
-            angle += step
-            #print(angle, current)
-            if current > maximum:
-                maximum = current
-                improved = True
-                # print("better")
-                value, counts = np.unique(np.round(np.real(complex_spectrum)/1000, 0), return_counts=True)
-                # print(len(counts))
-                # print(spstat.entropy(counts, base=2))
-            else:
-                #print("not really")
-                angle -= step
-                complex_spectrum = complex_spectrum*np.exp(-step*1j*np.pi)
-                step /= 10
-            if abs(step) < precision:
-                if not improved:
-                    #print("reversing!")
-                    step = -first_step
-                    improved = True
-                    continue
-                #print("end")
-                break
-            
-        return angle
+    def preview_phase(self, new_phase, points):
+        """
+        Returns real part of spectrum with phase correction self.phase.combined(new_phase)
+        computed on spectrum decimated to about points points, self is not changed. 
+        Used for fast redrawing while phase is changed interactively, 
+        stages of pipeline after phase correction are not applied.
+        """
+        phase = self.phase.combined(new_phase)
+        unphased = self.pipeline.output("digital_filter")
+        if unphased is None:
+            self.generate_spectrum()
+            unphased = self.pipeline.output("digital_filter")
+        
+        # decimated spectrum and its x axis are reused until spectrum, length or pivot are changed
+        factor = max(len(unphased) // points, 1)
+        if (self._preview_cache is None or self._preview_cache[0] is not unphased 
+                or self._preview_cache[1] != (factor, phase.pivot)):
+            x_axis = processing.phase_ramp(len(unphased), phase.pivot)
+            self._preview_cache = (unphased, (factor, phase.pivot), 
+                                   *phasing.decimate(unphased, x_axis, factor))
+        _, _, spectrum, x_axis = self._preview_cache
+        return np.real(spectrum*np.exp(1j*np.pi*(phase.ph0 + phase.ph1*x_axis)))
+    
+    def optimize_phase(self, first_order=False, objective="entropy", decimation=1):
+        """
+        Finds and applies phase correction with phasing.auto_phase, first order
+        correction is optimized only if first_order is True, otherwise current is kept.
+        Whole spectrum is searched, unless decimation (factor) is greater than 1,
+        then only final refinement uses whole spectrum.
+        Group delay is corrected by pipeline, so remaining first order correction is small
+        and coarse grid of ph1 is narrow.
+        """
+        unphased = self.pipeline.output("digital_filter")
+        if unphased is None:
+            self.generate_spectrum()
+            unphased = self.pipeline.output("digital_filter")
+        ph0, ph1 = phasing.auto_phase(unphased, self.phase.pivot, objective, first_order,
+                                      self.phase.ph1, ph1_range=0.1, grid_size=5,
+                                      decimation=decimation)
+        self.set_phase(Phase(ph0, ph1, None))
      
-    def calc_treshold(self, begin=0.0, end=0.05):
+    def calc_treshold(self, begin=None, end=None):
+        # without range threshold is noise level of spectrum, otherwise 
+        # average of positive values in range [fraction of spectrum] assumed to contain no signal
+        if begin is None or end is None:
+            self._signal_treshold = self.noise_level()
+            return
         if begin > end:
             begin, end = end, begin
             
@@ -472,21 +593,72 @@ class Spectrum_1D:
         
         self._signal_treshold = treshold
         
-    # def find_peaks(self):
-    #     # to be considered: minimum peak height and distance, low concentration spectra, solvent peaks
-    #     elem, _ = spsig.find_peaks(self.spectrum, height=50*self._signal_treshold, 
-    #                                distance=round((1/self.info["spectral_width"])*len(self.spectrum)))
-    #     elem = elem/len(self.spectrum)
-    #     self.auto_peak_list.extend(elem)
-        
-    #     elem = 1 - (elem / len(self.spectrum))
-    #     elem = elem*(self.info.plot_end_ppm - self.info.plot_begin_ppm)
-    #     elem = elem+self.info.plot_begin_ppm
-    #     # print(elem)
-        
+    def find_peaks(self, **params):
+        """
+        Fills self.auto_peak_list with peaks found by peak_picking.pick_peaks,
+        params are passed to it (threshold, snr, separation, prominence)
+        """
+        params.setdefault("noise_level", self.noise_level())
+        self.auto_peak_list = peak_picking.pick_peaks(self.spectrum, self.info, **params)
+        return self.auto_peak_list
+    
+    def deconvolve(self, begins=None, ends=None, vtype="fraction", model="lorentzian", workers=None):
+        """
+        Fits lines to self.spectrum with deconvolution.fit_regions, lines are seeded
+        by self.auto_peak_list and stored in self.fitted_lines
 
+        Parameters
+        ----------
+        begins, ends : arrays of numeric values [ppm or fraction], optional
+            bounds of fitted regions, peaks in every region are fitted together,
+            regions without peaks are skipped. If None, regions are made from
+            groups of overlapping peaks.
+        vtype : "ppm" or "fraction"
+        model : str
+            "lorentzian", "gaussian" or "pseudo_voigt".
+        workers : int, optional
+            number of worker processes, 0 fits in current process.
 
-        
+        Returns
+        -------
+        np.array of deconvolution.LINE_TYPE
+            fitted lines
+
+        """
+        peaks = self.auto_peak_list
+        hz_per_point = (self.info.plot_end - self.info.plot_begin) / len(self.spectrum)
+        if begins is None or ends is None:
+            regions = deconvolution.regions_from_peaks(peaks, len(self.spectrum), hz_per_point)
+        else:
+            _, _, begin_points, end_points = self._integration_bounds(
+                np.asarray(begins, dtype=np.double), np.asarray(ends, dtype=np.double), vtype)
+            regions = []
+            for begin, end in zip(begin_points.tolist(), end_points.tolist()):
+                indices = np.flatnonzero((peaks["index"] >= begin) & (peaks["index"] < end))
+                if len(indices):
+                    regions.append((max(begin, 0), min(end, len(self.spectrum)), indices))
+        lines = deconvolution.fit_regions(self.spectrum, regions, peaks, hz_per_point, model, workers)
+        self.fitted_lines = deconvolution.convert_units(lines, self.info, len(self.spectrum))
+        return self.fitted_lines
+    
+    def noise_correlation(self):
+        # [points] distance of independent points of noise, greater than one for zero filled spectrum
+        hz_per_point = (self.info.plot_end - self.info.plot_begin) / len(self.spectrum)
+        return max(self.info.frequency_increment / hz_per_point, 1)
+    
+    def noise_level(self):
+        """
+        Standard deviation of noise of self.spectrum estimated by noise.estimate_noise,
+        it is computed again only when self.spectrum is replaced (e.g. by generate_spectrum)
+        """
+        if self._noise_level is None or self._noise_level[0] is not self.spectrum:
+            level = noise.estimate_noise(self.spectrum, correlation=self.noise_correlation())
+            self._noise_level = (self.spectrum, float(level))
+        return self._noise_level[1]
+    
+    def snr(self, heights):
+        # signal to noise ratio of peaks of given heights
+        return noise.snr(heights, self.noise_level())
         
         
 # self.info - guaranteed keys:
@@ -0,0 +1,50 @@
+"""
+read_array has to decode the same arrays as read_array_reference,
+checked on every file in example_fids for all supported layouts of data.
+"""
+import os
+
+import numpy as np
+import pytest
+
+from file_io.general import read_array, read_array_reference, sizes
+
+EXAMPLES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "example_fids")
+CHECKED_TYPES = (np.int16, np.int32, np.int64, np.single, np.double)
+
+def example_files():
+    paths = []
+    for folder, _, filenames in sorted(os.walk(EXAMPLES)):
+        for filename in sorted(filenames):
+            if filename in ("fid", "ser") or filename.endswith(".jdf"):
+                paths.append(os.path.join(folder, filename))
+    return paths
+
+def layouts():
+    # (primary_type, complex_values, big_endian, reverse)
+    result = []
+    for primary_type in CHECKED_TYPES:
+        for complex_values in (False, True):
+            for big_endian in (False, True):
+                for reverse in ((False, True) if complex_values else (False,)):
+                    result.append((primary_type, complex_values, big_endian, reverse))
+    return result
+
+@pytest.fixture(scope="module", params=example_files(), 
+                ids=lambda path : os.path.relpath(path, EXAMPLES))
+def fid_content(request):
+    with open(request.param, "rb") as file:
+        return file.read()
+
+@pytest.mark.parametrize("primary_type, complex_values, big_endian, reverse", layouts(),
+                         ids=lambda value : getattr(value, "__name__", str(value)))
+def test_read_array_equals_reference(fid_content, primary_type, complex_values, big_endian, reverse):
+    el_number = len(fid_content) // sizes[primary_type] // (2 if complex_values else 1)
+    args = (fid_content, 0, el_number, primary_type, complex_values, big_endian, reverse)
+    fast = read_array(*args)
+    reference = read_array_reference(*args)
+    assert fast.dtype == reference.dtype
+    assert np.array_equal(fast, reference, equal_nan=primary_type in (np.single, np.double))
+
+def test_examples_found():
+    assert example_files()